@@ -67,6 +67,30 @@ def add_cron_email():
         sudo(env.tasks_bin + ' add_cron_email:' + env.environment)
 
 
+def add_cron_exports():
+    require('tasks_bin', provided_by=env.valid_envs)
+    with settings(warn_only=True):
+        sudo(env.tasks_bin + ' add_cron_exports:' + env.environment)
+
+
+def add_cron_notifications():
+    require('tasks_bin', provided_by=env.valid_envs)
+    with settings(warn_only=True):
+        sudo(env.tasks_bin + ' add_cron_notifications:' + env.environment)
+
+
+def add_cron_digests():
+    require('tasks_bin', provided_by=env.valid_envs)
+    with settings(warn_only=True):
+        sudo(env.tasks_bin + ' add_cron_digests:' + env.environment)
+
+
+def add_cron_mail():
+    require('tasks_bin', provided_by=env.valid_envs)
+    with settings(warn_only=True):
+        sudo(env.tasks_bin + ' add_cron_mail:' + env.environment)
+
+
 def correct_log_perms():
     require('django_dir', provided_by=env.valid_envs)
     log_path = os.path.join(env.django_dir, 'log', 'econsensus.log')
@@ -6,12 +6,28 @@ from dye.tasklib.django import _manage_py
 from dye.tasklib.util import _call_wrapper
 
 
+# Environments whose local settings have QUEUE_NOTIFICATIONS on, and so need
+# the cron jobs that send the queued notifications and the digests
+QUEUED_NOTIFICATION_ENVIRONMENTS = ('production', 'staging')
+
+# Environments whose local settings have EMAIL_BACKEND set to the mail spool,
+# and so need the cron job that sends the spooled mail
+SPOOLED_MAIL_ENVIRONMENTS = ('production', 'staging')
+
+
 def post_deploy(environment=None, svnuser=None, svnpass=None):
     load_auth_user(environment)
     load_django_site_data(environment)
     load_required_flat_pages(environment)
     load_waffles(environment)
+    create_cache_table()
     update_search_index()
+    add_cron_exports(environment)
+    if environment in QUEUED_NOTIFICATION_ENVIRONMENTS:
+        add_cron_notifications(environment)
+        add_cron_digests(environment)
+    if environment in SPOOLED_MAIL_ENVIRONMENTS:
+        add_cron_mail(environment)
 
 
 def load_sample_data(environment, force=False):
@@ -68,6 +84,11 @@ def _conditionally_load_data(environment, force, name, manage_cmd, fixture_suffi
         _manage_py(['loaddata', "default" + fixture_suffix + ".json"])
 
 
+def create_cache_table():
+    """create the cache table if the cache is kept in the database"""
+    _manage_py(['create_cache_table'])
+
+
 def update_search_index():
     _manage_py(['update_index'])
 
@@ -75,9 +96,6 @@ def update_search_index():
 def add_cron_email(environment):
     """sets up a cron job for the email checking"""
 
-    cron_file = os.path.join('/etc', 'cron.d', 'cron_email_%s' % environment)
-    if os.path.exists(cron_file):
-        return
     # has it been set up already?
     cron_grep = _call_wrapper('sudo crontab -l | grep %s' % tasklib.env['django_dir'], shell=True)
     if cron_grep == 0:
@@ -85,9 +103,42 @@ def add_cron_email(environment):
 
     # write something like:
     # */5 * * * * /usr/bin/python26 /var/django/econsensus/dev/django/econsensus/manage.py process_email
+    _add_cron_job(environment, 'email', '*/5 * * * *', 'process_email')
+
+
+def add_cron_exports(environment):
+    """sets up a cron job for generating background exports"""
+    _add_cron_job(environment, 'exports', '* * * * *', 'process_export_jobs')
+
+
+def add_cron_notifications(environment):
+    """sets up a cron job for sending queued notifications"""
+    _add_cron_job(environment, 'notifications', '* * * * *',
+                  'process_notifications')
+
+
+def add_cron_digests(environment):
+    """sets up cron jobs for sending hourly and daily notification digests"""
+    _add_cron_job(environment, 'hourly_digests', '0 * * * *',
+                  'send_digests hourly')
+    _add_cron_job(environment, 'daily_digests', '30 6 * * *',
+                  'send_digests daily')
+
+
+def add_cron_mail(environment):
+    """sets up a cron job for sending the emails in the outbound spool"""
+    _add_cron_job(environment, 'mail', '* * * * *', 'send_spooled_mail')
+
+
+def _add_cron_job(environment, name, schedule, manage_cmd):
+    cron_file = os.path.join('/etc', 'cron.d', 'cron_%s_%s' % (name, environment))
+    if os.path.exists(cron_file):
+        return
+
     f = open(cron_file, 'w')
     try:
-        f.write('*/5 * * * * apache /usr/bin/python26 %s/manage.py process_email' % tasklib.env['django_dir'])
+        f.write('%s apache /usr/bin/python26 %s/manage.py %s' % (
+            schedule, tasklib.env['django_dir'], manage_cmd))
         f.write('\n')
     finally:
         f.close()
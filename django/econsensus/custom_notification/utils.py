@@ -1,5 +1,13 @@
 from django.conf import settings
-from notification.models import ObservedItem, send
+from django.contrib.sites.models import Site
+from django.core.mail import EmailMessage, get_connection
+from django.core.urlresolvers import reverse
+from django.template import Context
+from django.template.loader import render_to_string
+from django.utils.translation import activate, get_language, ugettext
+from notification.models import (ObservedItem, send, Notice, NoticeType,
+    NoticeSetting, LanguageStoreNotAvailable, NOTICE_MEDIA,
+    get_notification_language, should_send, get_formatted_messages)
 
 def send_observation_notices_for(observed, signal="post_save", extra_context=None, headers=None, from_email=settings.DEFAULT_FROM_EMAIL):
     """
@@ -24,3 +32,104 @@ def send_notice_for(observed, user, label, signal="post_save", extra_context=Non
         extra_context = {}
     extra_context.update({"observed": observed})
     send([user], label, extra_context, headers, from_email=from_email)
+
+def _get_language(user):
+    try:
+        return get_notification_language(user)
+    except LanguageStoreNotAvailable:
+        return None
+
+def get_email_medium():
+    """
+    The medium notices are emailed through: the NOTIFICATION_EMAIL_MEDIUM
+    setting, or else the first of notification's media, which is email.
+    """
+    return getattr(settings, "NOTIFICATION_EMAIL_MEDIUM", NOTICE_MEDIA[0][0])
+
+def _wants_email(users, notice_type):
+    """
+    Returns the ids of those of the users whose notice settings say they
+    should be emailed notices of this type. Existing settings are looked
+    up together; notification's should_send() creates any missing ones
+    with their defaults.
+    """
+    medium = get_email_medium()
+    wanted = dict(NoticeSetting.objects.filter(
+        notice_type=notice_type, medium=medium,
+        user__in=[user.pk for user in users]
+    ).values_list('user', 'send'))
+    for user in users:
+        if user.pk not in wanted:
+            wanted[user.pk] = should_send(user, notice_type, medium)
+    return set(user_id for user_id, send in wanted.items() if send)
+
+def _render_notice(label, context):
+    """
+    Returns the on-site message, email subject and email body of a notice.
+    """
+    messages = get_formatted_messages(("short.txt", "full.txt", "notice.html"),
+                                      label, context)
+    # The emails are plain text
+    context.autoescape = False
+    subject = "".join(render_to_string("notification/email_subject.txt",
+        {"message": messages["short.txt"]}, context).splitlines())
+    body = render_to_string("notification/email_body.txt",
+        {"message": messages["full.txt"]}, context)
+    return messages["notice.html"], subject, body
+
+def send_to_all(users, label, extra_context=None, headers=None, from_email=settings.DEFAULT_FROM_EMAIL):
+    """
+    Sends a notice to each of the users, like notification.models.send(),
+    except that the templates are rendered once for each language the users
+    read their notices in rather than once for each user. Only the address
+    the email goes to differs from one user to the next, so the templates
+    can't use the 'recipient' that notification.models.send() gives them.
+    The emails are all sent over one connection.
+
+    With NOTIFICATION_QUEUE_ALL on, the notices are left to
+    notification.models.send() to queue, as for any other notice.
+    """
+    users = list(users)
+    if not users:
+        return
+    if getattr(settings, "NOTIFICATION_QUEUE_ALL", False):
+        send(users, label, extra_context, headers, from_email=from_email)
+        return
+    if extra_context is None:
+        extra_context = {}
+    notice_type = NoticeType.objects.get(label=label)
+    current_site = Site.objects.get_current()
+    protocol = getattr(settings, "DEFAULT_HTTP_PROTOCOL", "http")
+    notices_url = u"%s://%s%s" % (protocol, unicode(current_site),
+                                  reverse("notification_notices"))
+    wants_email = _wants_email(users, notice_type)
+
+    rendered = {}
+    notices = []
+    emails = []
+    current_language = get_language()
+    try:
+        for user in users:
+            language = _get_language(user)
+            if language not in rendered:
+                if language is not None:
+                    activate(language)
+                context = Context({
+                    "notice": ugettext(notice_type.display),
+                    "notices_url": notices_url,
+                    "current_site": current_site,
+                })
+                context.update(extra_context)
+                rendered[language] = _render_notice(label, context)
+            notice_message, subject, body = rendered[language]
+            notices.append(Notice(recipient=user, message=notice_message,
+                                  notice_type=notice_type, on_site=True))
+            if user.pk in wants_email and user.email and user.is_active:
+                emails.append(EmailMessage(subject, body, from_email,
+                                           [user.email], headers=headers))
+    finally:
+        activate(current_language)
+
+    Notice.objects.bulk_create(notices)
+    if emails:
+        get_connection().send_messages(emails)
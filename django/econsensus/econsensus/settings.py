@@ -64,6 +64,10 @@ MEDIA_ROOT = os.path.join(DJANGO_HOME, 'media')
 
 MEDIA_URL = '/media/'
 
+# Absolute filesystem path to the directory that will hold decision data
+# exports generated in the background. It must not be served publicly.
+EXPORT_ROOT = os.path.join(DJANGO_HOME, 'exports')
+
 # Absolute path to the directory static files should be collected to.
 # Don't put anything in this directory yourself; store your static files
 # in apps' "static/" subdirectories and in STATICFILES_DIRS.
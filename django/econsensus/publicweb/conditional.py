@@ -0,0 +1,148 @@
+"""
+Validators for conditional GET requests of the decision pages.
+
+A page only has to be rendered again if something it shows has changed:
+the decision's last_modified (updated by most changes to it and its
+feedback), its action items and the comments on its feedback, the counts
+in the nav, or something about the user viewing it (such as what they are
+watching). Otherwise the client's copy is revalidated with a 304 Not
+Modified response. Pages with messages waiting to be shown get no ETag, so
+they are always rendered.
+"""
+import hashlib
+
+from django.contrib import messages
+from django.contrib.comments.models import Comment
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import Count, Max, get_model
+from django.utils.translation import get_language
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+
+from notification.models import ObservedItem
+from organizations.models import Organization
+
+from publicweb.models import Decision, Feedback
+from publicweb.summary import get_summary_by_id
+
+
+def make_etag(*parts):
+    return hashlib.md5(
+        u'|'.join(unicode(part) for part in parts).encode('utf-8')
+    ).hexdigest()
+
+
+def _request_parts(request):
+    # The same page looks different to each user and in each language
+    return (request.user.id, get_language(), request.get_full_path())
+
+
+def _has_messages(request):
+    # Counting the messages doesn't mark them as shown
+    return bool(len(messages.get_messages(request)))
+
+
+def _summary_parts(organization_id):
+    # The counts in the nav, see publicweb.summary
+    return tuple(sorted(get_summary_by_id(organization_id).items()))
+
+
+def _comment_parts(feedback_ids):
+    """
+    The number of comments shown on the feedback and the newest of them,
+    which change when comments are posted, deleted or moderated.
+    """
+    state = Comment.objects.filter(
+        content_type=ContentType.objects.get_for_model(Feedback),
+        object_pk__in=[unicode(feedback_id) for feedback_id in feedback_ids],
+        is_public=True, is_removed=False
+    ).aggregate(newest=Max('id'), count=Count('id'))
+    return state['newest'], state['count']
+
+
+def _actionitem_parts(decision_id):
+    # Looked up here as importing it would be circular, see models.py
+    ActionItem = get_model('actionitems', 'ActionItem')
+    state = ActionItem.objects.filter(origin=decision_id)\
+        .aggregate(newest=Max('id'), count=Count('id'))
+    return state['newest'], state['count']
+
+
+def _observed_items(request):
+    return ObservedItem.objects.filter(user=request.user,
+        content_type=ContentType.objects.get_for_model(Decision))
+
+
+def decision_etag(request, pk, *args, **kwargs):
+    """
+    ETag of the pages of a single decision.
+    """
+    if _has_messages(request):
+        return None
+    state = Decision.objects.filter(pk=pk)\
+        .values_list('last_modified', 'organization')
+    if not state:
+        return None
+    last_modified, organization_id = state[0]
+    feedback_ids = Feedback.objects.filter(decision=pk)\
+        .values_list('id', flat=True)
+    watching = _observed_items(request).filter(object_id=pk).exists()
+    return make_etag(last_modified, watching,
+                     *(_comment_parts(feedback_ids) +
+                       _actionitem_parts(pk) +
+                       _summary_parts(organization_id) +
+                       _request_parts(request)))
+
+
+def feedback_etag(request, pk, *args, **kwargs):
+    """
+    ETag of the pages of a single piece of feedback. Changing feedback
+    updates its decision's last_modified.
+    """
+    if _has_messages(request):
+        return None
+    state = Feedback.objects.filter(pk=pk)\
+        .values_list('decision__last_modified', 'decision__organization')
+    if not state:
+        return None
+    last_modified, organization_id = state[0]
+    return make_etag(last_modified,
+                     *(_comment_parts([pk]) +
+                       _summary_parts(organization_id) +
+                       _request_parts(request)))
+
+
+def decision_list_etag(request, org_slug, *args, **kwargs):
+    """
+    ETag of the decision lists of an organization. The rows depend on the
+    organization's decisions: the newest last_modified, plus the count to
+    catch deletions. The nav shows the organization's summary. Adding or
+    removing a watch changes the count or the newest id of the user's
+    observed items.
+    """
+    if _has_messages(request):
+        return None
+    organization_ids = Organization.objects.filter(slug=org_slug)\
+        .values_list('id', flat=True)
+    if not organization_ids:
+        return None
+    state = Decision.objects.filter(organization=organization_ids[0])\
+        .aggregate(newest=Max('last_modified'), count=Count('id'))
+    watched = _observed_items(request)\
+        .aggregate(newest=Max('id'), count=Count('id'))
+    return make_etag(state['newest'], state['count'],
+                     watched['newest'], watched['count'],
+                     request.session.get('num'),
+                     *(_summary_parts(organization_ids[0]) +
+                       _request_parts(request)))
+
+
+def revalidated(etag_func):
+    """
+    Decorator for views whose pages the client may keep but has to
+    revalidate, using the ETag from etag_func, each time it shows them.
+    """
+    def decorator(view_func):
+        return cache_control(private=True, max_age=0, must_revalidate=True)(
+            condition(etag_func=etag_func)(view_func))
+    return decorator
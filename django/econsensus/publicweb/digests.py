@@ -0,0 +1,136 @@
+"""
+Digests of notifications, for users who would rather not get an email for
+each one.
+
+Notifications for them are held back as DigestEntry rows (see
+ObservationManager.hold_for_digests) and sent by the send_digests
+management command: one email, listing a line for each notification, per
+user and organization.
+"""
+from itertools import groupby
+
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.sites.models import Site
+from django.core.mail import EmailMessage, get_connection
+from django.core.urlresolvers import reverse
+from django.template import Context
+from django.template.loader import render_to_string
+
+from notification.models import NoticeType
+
+from custom_notification.utils import _wants_email
+from publicweb.extra_models import DigestEntry, STANDARD_SENDING_HEADERS
+from publicweb.observation_manager import get_decision
+
+
+def load_items(entries):
+    """
+    Sets the item of each of the entries, with one query per type of item.
+    The item is None if it has been deleted since.
+    """
+    ids_by_type = {}
+    for entry in entries:
+        ids_by_type.setdefault(entry.content_type_id, set()).add(
+            entry.object_id)
+    items = {}
+    for content_type_id, ids in ids_by_type.items():
+        model = ContentType.objects.get_for_id(content_type_id).model_class()
+        for pk, item in model._base_manager.in_bulk(list(ids)).items():
+            items[(content_type_id, pk)] = item
+    for entry in entries:
+        entry.item = items.get((entry.content_type_id, entry.object_id))
+
+
+def wanted_entries(entries):
+    """
+    Returns those of the entries that are for users who should be emailed
+    them: active users with an email address, whose notice settings say
+    they want emails of the entry's notice type. One query is made for the
+    settings of each notice type.
+    """
+    entries = [entry for entry in entries
+               if entry.user.is_active and entry.user.email]
+    users_by_label = {}
+    for entry in entries:
+        users_by_label.setdefault(entry.notice_type, {})[entry.user.pk] = \
+            entry.user
+    wanted = set()
+    for notice_type in NoticeType.objects.filter(
+            label__in=users_by_label.keys()):
+        users = users_by_label[notice_type.label].values()
+        for user_id in _wants_email(users, notice_type):
+            wanted.add((notice_type.label, user_id))
+    return [entry for entry in entries
+            if (entry.notice_type, entry.user_id) in wanted]
+
+
+def _render(template_name, context):
+    # Plain text, so nothing is escaped
+    return render_to_string(template_name,
+                            context_instance=Context(context, autoescape=False))
+
+
+def render_digest(user, organization, entries, frequency, current_site):
+    """
+    Returns the digest email of the entries for the user, or None if all of
+    their items have been deleted.
+    """
+    lines = []
+    for entry in entries:
+        if entry.item is None:
+            continue
+        context = {'observed': entry.item, 'current_site': current_site}
+        lines.append({
+            'summary': _render(
+                'notification/%s/short.txt' % entry.notice_type,
+                context).strip(),
+            'decision': get_decision(entry.item),
+        })
+    if not lines:
+        return None
+    context = {
+        'user': user,
+        'organization': organization,
+        'frequency': frequency,
+        'lines': lines,
+        'current_site': current_site,
+        'settings_url': reverse('notification_settings',
+                                args=[organization.slug]),
+    }
+    subject = ''.join(_render('notification/digest_subject.txt',
+                              context).splitlines())
+    body = _render('notification/digest_body.txt', context)
+    # From the organization's address, like its other notifications
+    from_email = lines[0]['decision'].get_email()
+    return EmailMessage(subject, body, from_email, [user.email],
+                        headers=STANDARD_SENDING_HEADERS)
+
+
+def send_digests(frequency):
+    """
+    Sends the digests of the entries held back for users who get them at
+    this frequency, over a single connection to the mail server, and
+    deletes the entries, including those for users who should no longer be
+    emailed them. Returns the number of emails sent.
+    """
+    entries = list(DigestEntry.objects.filter(frequency=frequency)
+                   .select_related('user', 'organization')
+                   .order_by('user', 'organization', 'id'))
+    if not entries:
+        return 0
+    wanted = wanted_entries(entries)
+    load_items(wanted)
+    current_site = Site.objects.get_current()
+
+    messages = []
+    for (user, organization), group in groupby(
+            wanted, lambda entry: (entry.user, entry.organization)):
+        message = render_digest(user, organization, list(group), frequency,
+                                current_site)
+        if message is not None:
+            messages.append(message)
+
+    sent = get_connection().send_messages(messages) if messages else 0
+    DigestEntry.objects.filter(id__in=[entry.id for entry in entries])\
+        .delete()
+    return sent or 0
@@ -0,0 +1,410 @@
+"""
+Export of an organization's decisions, feedback, comments and action items.
+
+The export is produced by generators so that it can be streamed to the
+client (or written to a file) row by row, without ever holding the whole
+organization's data in memory.
+"""
+import os
+from cStringIO import StringIO
+from datetime import datetime, time, timedelta
+from tempfile import TemporaryFile
+
+from django.conf import settings
+from django.contrib.comments.models import Comment
+from django.contrib.contenttypes.models import ContentType
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Count, Max
+from django.utils import timezone
+from django.utils import simplejson as json
+from django.utils.dateparse import parse_date, parse_datetime
+
+import unicodecsv
+
+from actionitems.models import ActionItem
+from publicweb.models import Decision, Feedback, ExportJob
+
+# Number of rows fetched from the database at a time
+DEFAULT_EXPORT_CHUNK_SIZE = 500
+
+# Seconds after which an export still running is taken to have been abandoned
+DEFAULT_EXPORT_JOB_TIMEOUT = 60 * 60
+
+# Seconds a superseded export is kept for, so that downloads of it can finish
+DEFAULT_EXPORT_GRACE_PERIOD = 60 * 60
+
+# Column title prefixes in the CSV export
+EXPORT_TITLES = {
+    Decision: 'Issue',
+    Feedback: 'Feedback',
+    Comment: 'Comment',
+    ActionItem: 'ActionItem',
+}
+
+# Fields left out of the export: the feedback counters can be worked out
+# from the exported feedback
+EXPORT_EXCLUDED = {
+    Decision: Decision.FEEDBACK_COUNT_FIELDS,
+}
+
+# Type of each object in the JSON export
+EXPORT_TYPES = {
+    Decision: 'decision',
+    Feedback: 'feedback',
+    Comment: 'comment',
+    ActionItem: 'actionitem',
+}
+
+
+def get_chunk_size():
+    return getattr(settings, 'EXPORT_CHUNK_SIZE', DEFAULT_EXPORT_CHUNK_SIZE)
+
+
+def queryset_chunks(queryset, chunk_size=None):
+    """
+    Iterates over a queryset in primary key order, yielding lists of at most
+    chunk_size objects. Unlike queryset.iterator(), the database driver
+    never has to hold more than one chunk of the result set, so memory use
+    stays constant however large the queryset is.
+    """
+    if chunk_size is None:
+        chunk_size = get_chunk_size()
+    queryset = queryset.order_by('pk')
+    last_pk = None
+    while True:
+        chunk = queryset
+        if last_pk is not None:
+            chunk = chunk.filter(pk__gt=last_pk)
+        chunk = list(chunk[:chunk_size])
+        if chunk:
+            yield chunk
+        if len(chunk) < chunk_size:
+            return
+        last_pk = chunk[-1].pk
+
+
+def queryset_iterator(queryset, chunk_size=None):
+    """
+    Iterates over a queryset in primary key order, chunk_size rows at a time.
+    """
+    for chunk in queryset_chunks(queryset, chunk_size):
+        for obj in chunk:
+            yield obj
+
+
+def group_by(objects, key):
+    """
+    Groups objects into a dict of lists keyed on the given attribute,
+    preserving their order.
+    """
+    groups = {}
+    for obj in objects:
+        groups.setdefault(getattr(obj, key), []).append(obj)
+    return groups
+
+
+def field_sorter(s):
+    """
+    Impose an order on certain fields.
+    Fields not specified below will appear in arbitrary order at end of
+    list.
+    """
+    if s == 'id': return '\t 00 %s' % s
+    elif s == 'creation': return '\t 01 %s' % s
+    elif s == 'submit_date': return '\t 02 %s' % s
+    elif s == 'author': return '\t 03 %s' % s
+    elif s == 'user': return '\t 04 %s' % s
+    elif s == 'user_name': return '\t 05 %s' % s
+    elif s == 'user_email': return '\t 06 %s' % s
+    elif s == 'user_url': return '\t 07 %s' % s
+    elif s == 'excerpt': return '\t 08 %s' % s
+    elif s == 'description': return '\t 09 %s' % s
+    elif s == 'budget': return '\t 10 %s' % s
+    elif s == 'people': return '\t 11 %s' % s
+    elif s == 'meeting_people': return '\t 12 %s' % s
+    elif s == 'effective_date': return '\t 13 %s' % s
+    elif s == 'deadline': return '\t 14 %s' % s
+    elif s == 'expiry_date': return '\t 15 %s' % s
+    elif s == 'review_date': return '\t 16 %s' % s
+    elif s == 'tags': return '\t 17 %s' % s
+    elif s == 'status': return '\t 18 %s' % s
+    elif s == 'last_status': return '\t 19 %s' % s
+    elif s == 'last_modified': return '\t 20 %s' % s
+    elif s == 'editor': return '\t 21 %s' % s
+    elif s == 'decided_date': return '\t 22 %s' % s
+    elif s == 'archived_date': return '\t 23 %s' % s
+    else: return s
+
+
+# Column plans, computed once per process: they only depend on the models
+_field_names = {}
+_json_fields = {}
+
+
+def get_field_names(model, excluded=()):
+    key = (model, tuple(excluded))
+    if key not in _field_names:
+        field_names = sorted(
+            list(set([field.name for field in model._meta.fields])),
+            key=field_sorter
+        )
+        _field_names[key] = [name for name in field_names
+                             if name not in excluded]
+    return _field_names[key]
+
+
+def get_json_fields(model):
+    """
+    Returns the attributes of a model exported as JSON. Relations are
+    exported as the id of the related object.
+    """
+    if model not in _json_fields:
+        _json_fields[model] = [model._meta.get_field(name).attname
+            for name in get_field_names(model, EXPORT_EXCLUDED.get(model, ()))]
+    return _json_fields[model]
+
+
+def field_value(obj, field_name):
+    if isinstance(obj, Feedback) and field_name == 'rating':
+        value = obj.get_rating_display()
+    else:
+        value = getattr(obj, field_name)
+    return unicode(value).encode("utf-8", "replace")
+
+
+def json_value(obj, attname):
+    if isinstance(obj, Feedback) and attname == 'rating':
+        return obj.get_rating_display()
+    return getattr(obj, attname)
+
+
+def parse_since(value):
+    """
+    Converts the value of a 'since' request parameter, either an ISO 8601
+    date or date and time, to an aware datetime. Raises ValueError if the
+    value can't be understood.
+    """
+    if not value:
+        return None
+    since = parse_datetime(value)
+    if since is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError("Invalid date/time '%s'" % value)
+        since = datetime.combine(day, time())
+    if timezone.is_naive(since):
+        since = timezone.make_aware(since, timezone.get_default_timezone())
+    return since
+
+
+def export_objects(organization, since=None):
+    """
+    Generator yielding the objects in the decision data export for an
+    organization: each decision, followed by its feedback (each followed by
+    its comments) and its action items.
+
+    If since is given only the changes made at or after that time are
+    exported: the decisions modified since then (adding or changing
+    feedback, comments or action items counts as modifying the decision),
+    with their feedback and action items, and the comments submitted since
+    then.
+    """
+    feedback_type = ContentType.objects.get_for_model(Feedback)
+    decisions = Decision.objects.filter(organization=organization)\
+        .select_related('author', 'editor')
+    comments = Comment.objects.filter(content_type=feedback_type)\
+        .select_related('user', 'site')
+    if since is not None:
+        decisions = decisions.filter(last_modified__gte=since)
+        comments = comments.filter(submit_date__gte=since)
+
+    # Each chunk of decisions costs a fixed number of queries: one each for
+    # the decisions, all their feedback, all the comments on that feedback
+    # and all their action items.
+    for chunk in queryset_chunks(decisions):
+        decision_ids = [decision.id for decision in chunk]
+        feedback_by_decision = group_by(
+            Feedback.objects.filter(decision__in=decision_ids)
+                .select_related('author', 'editor').order_by('id'),
+            'decision_id')
+        feedback_ids = [unicode(feedback.id)
+            for feedback_list in feedback_by_decision.values()
+            for feedback in feedback_list]
+        comments_by_feedback = {}
+        if feedback_ids:
+            comments_by_feedback = group_by(
+                comments.filter(object_pk__in=feedback_ids).order_by('id'),
+                'object_pk')
+        actionitems_by_decision = group_by(
+            ActionItem.objects.filter(origin__in=decision_ids).order_by('id'),
+            'origin_id')
+
+        for decision in chunk:
+            yield decision
+            for feedback in feedback_by_decision.get(decision.id, []):
+                yield feedback
+                for comment in comments_by_feedback.get(unicode(feedback.id), []):
+                    yield comment
+            for actionitem in actionitems_by_decision.get(decision.id, []):
+                yield actionitem
+
+
+def export_rows(organization, since=None):
+    """
+    Generator yielding the rows of the CSV export for an organization: a
+    title row followed by a row for each exported object, with the columns
+    of the other types of object left blank.
+    """
+    # Remove fields implied by filename (organization) or csv layout:
+    field_names = [
+        (Decision, get_field_names(Decision,
+            ('organization',) + Decision.FEEDBACK_COUNT_FIELDS)),
+        (Feedback, get_field_names(Feedback, ('decision',))),
+        (Comment, get_field_names(Comment, ('content_type', 'object_pk'))),
+        (ActionItem, get_field_names(ActionItem, ('origin',))),
+    ]
+    yield ["%s.%s" % (EXPORT_TITLES[model], name)
+           for model, names in field_names for name in names]
+
+    # Blank columns before and after each type of object's columns
+    padding = {}
+    columns = 0
+    total = sum(len(names) for model, names in field_names)
+    for model, names in field_names:
+        padding[model] = ([u""] * columns,
+                          [u""] * (total - columns - len(names)))
+        columns += len(names)
+    field_names = dict(field_names)
+
+    for obj in export_objects(organization, since):
+        model = type(obj)
+        before, after = padding[model]
+        yield before + [field_value(obj, field_name)
+                        for field_name in field_names[model]] + after
+
+
+def export_ndjson(organization, since=None):
+    """
+    Generator yielding the decision data export for an organization as
+    newline delimited JSON: one object per line, each with its type and
+    linked to its decision or feedback by id.
+    """
+    for obj in export_objects(organization, since):
+        model = type(obj)
+        data = {'type': EXPORT_TYPES[model]}
+        for attname in get_json_fields(model):
+            data[attname] = json_value(obj, attname)
+        yield json.dumps(data, cls=DjangoJSONEncoder) + '\n'
+
+
+def export_csv(organization, since=None):
+    """
+    Generator yielding the decision data export for an organization as
+    CSV, one encoded line at a time.
+    """
+    buf = StringIO()
+    writer = unicodecsv.writer(buf)
+    for row in export_rows(organization, since):
+        writer.writerow(row)
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+
+
+# Export formats: (generator, mimetype, file extension)
+EXPORT_FORMATS = {
+    'csv': (export_csv, 'text/csv', 'csv'),
+    'ndjson': (export_ndjson, 'application/x-ndjson', 'ndjson'),
+}
+
+
+def get_export_file_name(organization, key=None, extension='csv'):
+    name = 'econsensus_decision_data_%s' % organization.slug
+    if key:
+        name = '%s_%s' % (name, key)
+    return '%s.%s' % (name, extension)
+
+
+def get_export_storage():
+    """
+    Exports are kept out of MEDIA_ROOT so that they can only be downloaded
+    through the (login protected) export views.
+    """
+    return FileSystemStorage(location=settings.EXPORT_ROOT)
+
+
+def get_export_key(organization):
+    """
+    Identifies the current state of an organization's data. Any change to a
+    decision, its feedback, comments or action items updates the decision's
+    last_modified, and the count catches deleted decisions.
+    """
+    state = Decision.objects.filter(organization=organization).aggregate(
+        newest=Max('last_modified'), count=Count('id'))
+    newest = state['newest']
+    newest = newest.strftime('%Y%m%d%H%M%S%f') if newest else 'empty'
+    return '%s-%d' % (newest, state['count'])
+
+
+def request_export_job(organization):
+    """
+    Returns the export job for the current state of the organization's
+    data, creating it (or retrying it, if it failed) as necessary.
+    """
+    job, _ = ExportJob.objects.get_or_create(
+        organization=organization, key=get_export_key(organization))
+    if job.status == ExportJob.FAILED_STATUS:
+        job.status = ExportJob.PENDING_STATUS
+        job.save()
+    return job
+
+
+def run_export_job(job):
+    """
+    Writes the export for a claimed job to the export storage and removes
+    the files of older exports for the same organization that have been
+    superseded for long enough.
+    """
+    storage = get_export_storage()
+    with TemporaryFile() as temp:
+        for line in export_csv(job.organization):
+            temp.write(line)
+        temp.seek(0)
+        name = os.path.join(job.organization.slug,
+                            get_export_file_name(job.organization, job.key))
+        job.file_name = storage.save(name, File(temp))
+    job.status = ExportJob.DONE_STATUS
+    job.completed = timezone.now()
+    job.save()
+    remove_superseded_exports(job.organization)
+
+
+def remove_superseded_exports(organization):
+    """
+    Removes the files of the organization's exports that were superseded
+    by one finished more than EXPORT_GRACE_PERIOD seconds ago, by which
+    time any downloads of them should have finished.
+    """
+    storage = get_export_storage()
+    cutoff = timezone.now() - timedelta(seconds=getattr(settings,
+        'EXPORT_GRACE_PERIOD', DEFAULT_EXPORT_GRACE_PERIOD))
+    done = ExportJob.objects.filter(organization=organization,
+                                    status=ExportJob.DONE_STATUS)
+    newest = done.filter(completed__lt=cutoff).order_by('-requested')[:1]
+    if not newest:
+        return
+    for old_job in done.filter(requested__lt=newest[0].requested):
+        storage.delete(old_job.file_name)
+        old_job.delete()
+
+
+def release_abandoned_export_jobs():
+    """
+    Returns export jobs left running for longer than EXPORT_JOB_TIMEOUT
+    seconds, whose workers must have died, to pending so that they are run
+    again. Returns how many there were.
+    """
+    return ExportJob.release_stale(getattr(settings, 'EXPORT_JOB_TIMEOUT',
+                                           DEFAULT_EXPORT_JOB_TIMEOUT))
@@ -1,9 +1,14 @@
 """
 This file contains models that must be removed from the models.py file to prevent circular imports
 """
+from datetime import timedelta
+
 from django.db import models
+from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 from django.contrib.auth.models import User
+from django.contrib.contenttypes import generic
+from django.contrib.contenttypes.models import ContentType
 from organizations.models import Organization
 
 STANDARD_SENDING_HEADERS = {'Precedence': 'bulk', 'Auto-Submitted': 'auto-generated'}
@@ -28,6 +33,15 @@ NOTIFICATION_LEVELS = (
           (MINOR_CHANGES_NOTIFICATIONS, MINOR_CHANGES_NOTIFICATIONS_TEXT)
                       )
 
+IMMEDIATE_DELIVERY = 'immediate'
+HOURLY_DIGEST = 'hourly'
+DAILY_DIGEST = 'daily'
+DIGEST_FREQUENCIES = (
+          (IMMEDIATE_DELIVERY, _("Send each notification straight away")),
+          (HOURLY_DIGEST, _("Send an hourly digest")),
+          (DAILY_DIGEST, _("Send a daily digest")),
+                      )
+
 
 class NotificationSettings(models.Model):
     user = models.ForeignKey(User)
@@ -38,6 +52,13 @@ class NotificationSettings(models.Model):
         help_text=_("Levels are cumulative, so if, for example, you choose to "
             "get notifications of replies to feedback, you will get "
             "notifications of all changes to main items as well."))
+    digest_frequency = models.CharField(choices=DIGEST_FREQUENCIES,
+        default=IMMEDIATE_DELIVERY,
+        max_length=10,
+        verbose_name=_("Delivery"),
+        help_text=_("New items and status changes are always sent straight "
+            "away. Everything else can be collected into one email an hour "
+            "or a day."))
 
     class Meta:
         unique_together = ('user', 'organization')
@@ -48,3 +69,132 @@ class OrganizationSettings(models.Model):
         help_text=_("Levels are cumulative, so if, for example, you choose to "
             "get notifications of replies to feedback, you will get "
             "notifications of all changes to main items as well."))
+
+
+class ClaimableJob(models.Model):
+    """
+    Base of the models of work done in the background by management
+    commands, several of which can run at once: a worker claims a pending
+    job before starting on it, so that no other worker does it too. A job
+    whose worker died before finishing it is left claimed, so jobs claimed
+    longer ago than a timeout can be released to be tried again.
+    Subclasses have a status field.
+    """
+    PENDING_STATUS = 'pending'
+    RUNNING_STATUS = 'running'
+
+    claimed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        abstract = True
+
+    def claim(self):
+        """
+        Marks a pending job as running. Returns False if another worker got
+        there first.
+        """
+        now = timezone.now()
+        claimed = self.__class__.objects.filter(
+            pk=self.pk, status=self.PENDING_STATUS
+        ).update(status=self.RUNNING_STATUS, claimed_at=now)
+        if claimed:
+            self.status = self.RUNNING_STATUS
+            self.claimed_at = now
+        return bool(claimed)
+
+    @classmethod
+    def release_stale(cls, timeout):
+        """
+        Returns the jobs claimed more than timeout seconds ago to pending.
+        Returns how many there were.
+        """
+        return cls.objects.filter(
+            status=cls.RUNNING_STATUS,
+            claimed_at__lt=timezone.now() - timedelta(seconds=timeout)
+        ).update(status=cls.PENDING_STATUS)
+
+
+class Lease(models.Model):
+    """
+    Lets only one process at a time do something, such as sending the mail
+    spool at a rate limit. A process holds the lease, by name, until it
+    releases it or stops renewing it for longer than the lease lasts.
+    """
+    name = models.CharField(max_length=50, unique=True)
+    holder = models.CharField(max_length=100, blank=True)
+    expires = models.DateTimeField(null=True, blank=True)
+
+    @classmethod
+    def acquire(cls, name, holder, duration):
+        """
+        Takes the lease for duration seconds if no other holder has it.
+        Returns False if one does.
+        """
+        cls.objects.get_or_create(name=name)
+        now = timezone.now()
+        return bool(cls.objects.filter(name=name).filter(
+            models.Q(holder=holder) | models.Q(expires__isnull=True) |
+            models.Q(expires__lt=now)
+        ).update(holder=holder, expires=now + timedelta(seconds=duration)))
+
+    @classmethod
+    def renew(cls, name, holder, duration):
+        """
+        Extends a lease the holder has. Returns False if it has lost it.
+        """
+        return bool(cls.objects.filter(name=name, holder=holder).update(
+            expires=timezone.now() + timedelta(seconds=duration)))
+
+    @classmethod
+    def release(cls, name, holder):
+        cls.objects.filter(name=name, holder=holder).update(holder='',
+                                                           expires=None)
+
+
+class NotificationJob(ClaimableJob):
+    """
+    Notifications about an item (a decision, feedback or comment) queued to
+    be sent in the background by the process_notifications management
+    command, rather than during the request that caused them. The
+    recipients are the users to consider notifying, as a JSON list of ids;
+    their notification settings are only looked up when the job is run.
+    Finished jobs are deleted.
+    """
+    FAILED_STATUS = 'failed'
+
+    STATUS_CHOICES = (
+                  (ClaimableJob.PENDING_STATUS, _('pending')),
+                  (ClaimableJob.RUNNING_STATUS, _('running')),
+                  (FAILED_STATUS, _('failed')),
+                  )
+
+    notice_type = models.CharField(max_length=40)
+    content_type = models.ForeignKey(ContentType)
+    object_id = models.PositiveIntegerField()
+    item = generic.GenericForeignKey('content_type', 'object_id')
+    recipients = models.TextField()
+    headers = models.TextField()
+    from_email = models.CharField(max_length=255)
+    status = models.CharField(choices=STATUS_CHOICES,
+                              default=ClaimableJob.PENDING_STATUS,
+                              max_length=10,
+                              db_index=True)
+    requested = models.DateTimeField(auto_now_add=True)
+
+
+class DigestEntry(models.Model):
+    """
+    A notification about an item held back for a user who gets digests. The
+    send_digests management command sends the entries of each user and
+    organization as one email per period, then deletes them.
+    """
+    user = models.ForeignKey(User)
+    organization = models.ForeignKey(Organization)
+    frequency = models.CharField(choices=DIGEST_FREQUENCIES,
+                                 max_length=10,
+                                 db_index=True)
+    notice_type = models.CharField(max_length=40)
+    content_type = models.ForeignKey(ContentType)
+    object_id = models.PositiveIntegerField()
+    item = generic.GenericForeignKey('content_type', 'object_id')
+    created = models.DateTimeField(auto_now_add=True)
@@ -16,7 +16,8 @@ from publicweb.models import NotificationSettings, change_observers, \
 
 from parsley.decorators import parsleyfy
 from actionitems.forms import ActionItemCreateForm, ActionItemUpdateForm
-from publicweb.extra_models import MAIN_ITEMS_NOTIFICATIONS_ONLY
+from publicweb.extra_models import MAIN_ITEMS_NOTIFICATIONS_ONLY, \
+    IMMEDIATE_DELIVERY
 from actionitems.models import ActionItem
 
 
@@ -150,5 +151,14 @@ class NotificationSettingsForm(forms.ModelForm):
         model = NotificationSettings
         exclude = ('user', 'organization')
         widgets = {
-            'notification_level': RadioSelect
+            'notification_level': RadioSelect,
+            'digest_frequency': RadioSelect
         }
+
+    def __init__(self, *args, **kwargs):
+        super(NotificationSettingsForm, self).__init__(*args, **kwargs)
+        self.fields['digest_frequency'].required = False
+
+    def clean_digest_frequency(self):
+        # Forms posted without a choice get notifications straight away
+        return self.cleaned_data['digest_frequency'] or IMMEDIATE_DELIVERY
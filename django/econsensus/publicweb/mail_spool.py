@@ -0,0 +1,163 @@
+"""
+Outbound mail spool.
+
+With EMAIL_BACKEND set to 'publicweb.mail_spool.SpoolEmailBackend', sending
+an email only stores it, as a SpooledEmail. The send_spooled_mail
+management command then sends the stored emails through the
+EMAIL_SPOOL_BACKEND (SMTP by default) in batches of EMAIL_SPOOL_BATCH_SIZE,
+over one connection that is kept open for as long as it works, and at no
+more than EMAIL_SPOOL_RATE_LIMIT emails a minute. Emails that can't be sent
+are retried after EMAIL_SPOOL_RETRY_DELAY seconds, twice as long after each
+further attempt, up to EMAIL_SPOOL_MAX_ATTEMPTS attempts.
+
+Only one sender runs at a time, so that the rate limit holds however the
+command is started: it holds a lease, renewed as it sends, which lapses
+EMAIL_SPOOL_LEASE_TIMEOUT seconds after a sender dies. Emails a dead sender
+had claimed are sent again once they have been claimed for
+EMAIL_SPOOL_CLAIM_TIMEOUT seconds.
+"""
+import logging
+import os
+import smtplib
+import socket
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.core.mail.backends.base import BaseEmailBackend
+from django.utils import timezone
+
+from publicweb.extra_models import Lease
+from publicweb.models import SpooledEmail
+
+DEFAULT_SPOOL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+DEFAULT_BATCH_SIZE = 100
+# Emails a minute, 0 for no limit
+DEFAULT_RATE_LIMIT = 0
+DEFAULT_RETRY_DELAY = 60
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_LEASE_TIMEOUT = 5 * 60
+DEFAULT_CLAIM_TIMEOUT = 10 * 60
+
+LEASE_NAME = 'send_spooled_mail'
+
+logger = logging.getLogger('econsensus')
+
+
+class SpoolEmailBackend(BaseEmailBackend):
+    """
+    Stores emails to be sent by the send_spooled_mail management command.
+    """
+    def send_messages(self, email_messages):
+        spooled = []
+        for message in email_messages:
+            if not message.recipients():
+                continue
+            email = SpooledEmail()
+            email.message = message
+            spooled.append(email)
+        SpooledEmail.objects.bulk_create(spooled)
+        return len(spooled)
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _failed(email, error, permanent=False):
+    """
+    Schedules the email to be tried again later or, if it has been tried
+    too many times or can never be sent, marks it as failed.
+    """
+    email.attempts += 1
+    email.last_error = u'%s: %s' % (error.__class__.__name__, error)
+    if permanent or email.attempts >= _setting('EMAIL_SPOOL_MAX_ATTEMPTS',
+                                               DEFAULT_MAX_ATTEMPTS):
+        email.status = SpooledEmail.FAILED_STATUS
+        logger.error("Giving up sending spooled email %s: %s"
+                     % (email.id, email.last_error))
+    else:
+        delay = _setting('EMAIL_SPOOL_RETRY_DELAY', DEFAULT_RETRY_DELAY)
+        email.status = SpooledEmail.PENDING_STATUS
+        email.next_attempt = timezone.now() + timedelta(
+            seconds=delay * 2 ** (email.attempts - 1))
+        logger.warning("Failed to send spooled email %s, will retry: %s"
+                       % (email.id, email.last_error))
+    email.save()
+
+
+def send_spooled_mail():
+    """
+    Sends the spooled emails that are due, until there are none left.
+    Returns the number of emails sent, or None if another sender is
+    running.
+    """
+    holder = '%s:%s' % (socket.gethostname(), os.getpid())
+    lease_timeout = _setting('EMAIL_SPOOL_LEASE_TIMEOUT',
+                             DEFAULT_LEASE_TIMEOUT)
+    if not Lease.acquire(LEASE_NAME, holder, lease_timeout):
+        return None
+    try:
+        released = SpooledEmail.release_stale(_setting(
+            'EMAIL_SPOOL_CLAIM_TIMEOUT', DEFAULT_CLAIM_TIMEOUT))
+        if released:
+            logger.warning("Retrying %s spooled emails left claimed by a "
+                           "sender that stopped" % released)
+        return _send_due(lambda: Lease.renew(LEASE_NAME, holder,
+                                             lease_timeout))
+    finally:
+        Lease.release(LEASE_NAME, holder)
+
+
+def _send_due(renew_lease):
+    batch_size = _setting('EMAIL_SPOOL_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+    rate_limit = _setting('EMAIL_SPOOL_RATE_LIMIT', DEFAULT_RATE_LIMIT)
+    interval = 60.0 / rate_limit if rate_limit else 0
+    connection = get_connection(_setting('EMAIL_SPOOL_BACKEND',
+                                         DEFAULT_SPOOL_BACKEND))
+    sent = 0
+    last_sent = None
+    is_open = False
+    try:
+        while True:
+            batch = list(SpooledEmail.objects.filter(
+                status=SpooledEmail.PENDING_STATUS,
+                next_attempt__lte=timezone.now()
+            ).order_by('id')[:batch_size])
+            if not batch:
+                break
+            for email in batch:
+                if not renew_lease():
+                    logger.warning("Lost the mail spool lease, stopping")
+                    return sent
+                if not email.claim():
+                    continue
+                if not is_open:
+                    try:
+                        connection.open()
+                    except Exception as e:
+                        # The server can't be reached, so neither can the
+                        # rest be sent for now
+                        _failed(email, e)
+                        return sent
+                    is_open = True
+                if interval and last_sent is not None:
+                    time.sleep(max(0, last_sent + interval - time.time()))
+                last_sent = time.time()
+                try:
+                    connection.send_messages([email.message])
+                except smtplib.SMTPRecipientsRefused as e:
+                    _failed(email, e, permanent=True)
+                except Exception as e:
+                    _failed(email, e)
+                    # Start again with a new connection
+                    connection.close()
+                    is_open = False
+                else:
+                    email.delete()
+                    sent += 1
+    finally:
+        if is_open:
+            connection.close()
+    return sent
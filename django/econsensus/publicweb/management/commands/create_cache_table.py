@@ -0,0 +1,21 @@
+#management command to create the database cache table on deploy
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+DATABASE_CACHE_BACKEND = 'django.core.cache.backends.db.DatabaseCache'
+
+
+class Command(BaseCommand):
+    args = ''
+    help = ('Creates the cache table, if the cache is kept in the database '
+            'and the table does not exist yet.')
+
+    def handle(self, *args, **options):
+        cache = settings.CACHES['default']
+        if cache['BACKEND'] != DATABASE_CACHE_BACKEND:
+            return
+        if cache['LOCATION'] in connection.introspection.table_names():
+            return
+        call_command('createcachetable', cache['LOCATION'])
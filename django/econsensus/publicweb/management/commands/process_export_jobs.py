@@ -0,0 +1,42 @@
+#management command to generate the files for background exports
+import logging
+
+from django.core.management.base import BaseCommand
+
+from publicweb.export import run_export_job, release_abandoned_export_jobs
+from publicweb.models import ExportJob
+
+
+class Command(BaseCommand):
+    args = ''
+    help = 'Generates the files for pending decision data exports.'
+
+    def handle(self, *args, **options):
+        verbosity = int(options.get('verbosity', 1))
+        logger = logging.getLogger('econsensus')
+
+        released = release_abandoned_export_jobs()
+        if released:
+            logger.warning("Retrying %s abandoned export jobs" % released)
+
+        pending = ExportJob.objects.filter(
+            status=ExportJob.PENDING_STATUS).order_by('requested')
+        for job in pending:
+            # Several workers can run at once, only one of them gets the job
+            if not job.claim():
+                continue
+            self._print_if_verbose(verbosity,
+                "Exporting data for organization '%s'" % job.organization)
+            try:
+                run_export_job(job)
+            except Exception as e:
+                logger.error(e)
+                job.status = ExportJob.FAILED_STATUS
+                job.save()
+            else:
+                logger.info("Exported data for organization '%s' to '%s'"
+                            % (job.organization, job.file_name))
+
+    def _print_if_verbose(self, verbosity, message):
+        if verbosity > 1:
+            print message
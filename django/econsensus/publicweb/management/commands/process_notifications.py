@@ -0,0 +1,49 @@
+#management command to send queued notifications
+import logging
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from publicweb.extra_models import NotificationJob
+from publicweb.observation_manager import send_queued_notifications
+
+# Seconds after which a job still running is taken to have been abandoned
+DEFAULT_NOTIFICATION_JOB_TIMEOUT = 10 * 60
+
+
+class Command(BaseCommand):
+    args = ''
+    help = 'Sends the notifications queued while QUEUE_NOTIFICATIONS is on.'
+
+    def handle(self, *args, **options):
+        verbosity = int(options.get('verbosity', 1))
+        logger = logging.getLogger('econsensus')
+
+        # Retry the jobs of workers that died before finishing them
+        released = NotificationJob.release_stale(getattr(settings,
+            'NOTIFICATION_JOB_TIMEOUT', DEFAULT_NOTIFICATION_JOB_TIMEOUT))
+        if released:
+            logger.warning("Retrying %s abandoned notification jobs"
+                           % released)
+
+        pending = NotificationJob.objects.filter(
+            status=NotificationJob.PENDING_STATUS).order_by('id')
+        for job in pending.iterator():
+            # Several workers can run at once, only one of them gets the job
+            if not job.claim():
+                continue
+            self._print_if_verbose(verbosity,
+                "Sending '%s' notifications for %s %s"
+                % (job.notice_type, job.content_type, job.object_id))
+            try:
+                send_queued_notifications(job)
+            except Exception as e:
+                logger.error(e)
+                job.status = NotificationJob.FAILED_STATUS
+                job.save()
+            else:
+                job.delete()
+
+    def _print_if_verbose(self, verbosity, message):
+        if verbosity > 1:
+            print message
@@ -0,0 +1,35 @@
+#management command to repair the stored feedback counters of decisions
+import logging
+
+from django.core.management.base import BaseCommand
+
+from publicweb.models import Decision
+
+
+class Command(BaseCommand):
+    args = ''
+    help = 'Recomputes the stored feedback counters of every decision.'
+
+    def handle(self, *args, **options):
+        verbosity = int(options.get('verbosity', 1))
+        logger = logging.getLogger('econsensus')
+
+        repaired = 0
+        decisions = Decision.objects.values_list(
+            'id', *Decision.FEEDBACK_COUNT_FIELDS)
+        for row in decisions.iterator():
+            decision_id = row[0]
+            stored = dict(zip(Decision.FEEDBACK_COUNT_FIELDS, row[1:]))
+            counts = Decision.count_feedback(decision_id)
+            if counts != stored:
+                # Only the counters are written, last_modified is untouched
+                Decision.objects.filter(id=decision_id).update(**counts)
+                repaired += 1
+                self._print_if_verbose(verbosity,
+                    "Repaired feedback counters of decision %d" % decision_id)
+        logger.info("Repaired the feedback counters of %d decisions"
+                    % repaired)
+
+    def _print_if_verbose(self, verbosity, message):
+        if verbosity > 1:
+            print message
@@ -0,0 +1,33 @@
+#management command to send the digests of held back notifications
+import logging
+
+from django.core.management.base import BaseCommand, CommandError
+
+from publicweb.digests import send_digests
+from publicweb.extra_models import HOURLY_DIGEST, DAILY_DIGEST
+
+
+class Command(BaseCommand):
+    args = '<%s|%s>' % (HOURLY_DIGEST, DAILY_DIGEST)
+    help = ('Sends the digests of the notifications held back for users who '
+            'get them at the given frequency.')
+
+    def handle(self, *args, **options):
+        verbosity = int(options.get('verbosity', 1))
+        logger = logging.getLogger('econsensus')
+
+        if len(args) != 1 or args[0] not in (HOURLY_DIGEST, DAILY_DIGEST):
+            raise CommandError("Usage: send_digests %s" % self.args)
+        frequency = args[0]
+        try:
+            sent = send_digests(frequency)
+        except Exception as e:
+            # The entries are kept, to be sent next time
+            logger.error(e)
+            raise
+        self._print_if_verbose(verbosity,
+            "Sent %s %s digests" % (sent, frequency))
+
+    def _print_if_verbose(self, verbosity, message):
+        if verbosity > 1:
+            print message
@@ -0,0 +1,22 @@
+#management command to send the emails stored by the SpoolEmailBackend
+from django.core.management.base import BaseCommand
+
+from publicweb.mail_spool import send_spooled_mail
+
+
+class Command(BaseCommand):
+    args = ''
+    help = 'Sends the emails waiting in the outbound mail spool.'
+
+    def handle(self, *args, **options):
+        verbosity = int(options.get('verbosity', 1))
+        sent = send_spooled_mail()
+        if sent is None:
+            self._print_if_verbose(verbosity,
+                "Another sender is running, not sending")
+        else:
+            self._print_if_verbose(verbosity, "Sent %s spooled emails" % sent)
+
+    def _print_if_verbose(self, verbosity, message):
+        if verbosity > 1:
+            print message
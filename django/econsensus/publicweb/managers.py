@@ -1,19 +1,180 @@
 #Model managers for models
-from django.db import models
-from django.db.models.aggregates import Count
+from django.conf import settings
+from django.db import connection, models
+
+_column_collations = {}
+
+
+def _get_column_collation(table, column):
+    key = (table, column)
+    if key not in _column_collations:
+        cursor = connection.cursor()
+        cursor.execute("SELECT collation_name FROM information_schema.columns "
+                       "WHERE table_schema = DATABASE() AND table_name = %s "
+                       "AND column_name = %s", [table, column])
+        row = cursor.fetchone()
+        _column_collations[key] = row[0] if row else None
+    return _column_collations[key]
+
+
+def has_case_insensitive_collation(model, field_name):
+    """
+    Whether the field's column already compares and sorts text regardless
+    of case, so that it can be ordered as it is, straight from an index.
+    The CASE_INSENSITIVE_COLLATION setting says so for all columns if it is
+    set. Otherwise the column's collation is looked up on MySQL (whose _ci
+    collations are case insensitive), and assumed to be case sensitive on
+    other databases.
+    """
+    setting = getattr(settings, 'CASE_INSENSITIVE_COLLATION', None)
+    if setting is not None:
+        return setting
+    if connection.vendor != 'mysql':
+        return False
+    collation = _get_column_collation(model._meta.db_table,
+        model._meta.get_field(field_name).column)
+    return bool(collation) and collation.endswith('_ci')
+
+
+class ChainedQuerySets(object):
+    """
+    The results of several querysets, one after the other, which can be
+    used much like a single queryset: filtered, counted, sliced (e.g. by a
+    Paginator) and iterated over. Methods that return a new queryset are
+    applied to each of the querysets, except for order_by(), which would
+    undo the order of the chain.
+    """
+    def __init__(self, *querysets):
+        self.querysets = querysets
+        self.model = querysets[0].model
+        self.db = querysets[0].db
+        self.ordered = True
+        self._counts = None
+        self._result_cache = None
+
+    def _chain(self, method, *args, **kwargs):
+        return ChainedQuerySets(*[getattr(queryset, method)(*args, **kwargs)
+                                  for queryset in self.querysets])
+
+    def all(self):
+        return self._chain('all')
+
+    def filter(self, *args, **kwargs):
+        return self._chain('filter', *args, **kwargs)
+
+    def exclude(self, *args, **kwargs):
+        return self._chain('exclude', *args, **kwargs)
+
+    def only(self, *fields):
+        return self._chain('only', *fields)
+
+    def defer(self, *fields):
+        return self._chain('defer', *fields)
+
+    def select_related(self, *fields, **kwargs):
+        return self._chain('select_related', *fields, **kwargs)
+
+    def prefetch_related(self, *lookups):
+        return self._chain('prefetch_related', *lookups)
+
+    def using(self, alias):
+        return self._chain('using', alias)
+
+    def none(self):
+        return self.querysets[0].none()
+
+    def _get_counts(self):
+        if self._counts is None:
+            if self._result_cache is not None:
+                self._counts = [len(results)
+                                for results in self._result_cache]
+            else:
+                self._counts = [queryset.count()
+                                for queryset in self.querysets]
+        return self._counts
+
+    def count(self):
+        return sum(self._get_counts())
+
+    def exists(self):
+        if self._result_cache is not None:
+            return bool(self.count())
+        return any(queryset.exists() for queryset in self.querysets)
+
+    def _fetch_all(self):
+        # Like a queryset, the results are fetched once and kept
+        if self._result_cache is None:
+            self._result_cache = [list(queryset)
+                                  for queryset in self.querysets]
+        return self._result_cache
+
+    def __len__(self):
+        return sum(len(results) for results in self._fetch_all())
+
+    def __nonzero__(self):
+        return self.exists()
+
+    def __iter__(self):
+        for results in self._fetch_all():
+            for obj in results:
+                yield obj
+
+    def __getitem__(self, k):
+        if not isinstance(k, slice):
+            try:
+                return self[k:k + 1][0]
+            except IndexError:
+                raise IndexError("ChainedQuerySets index out of range")
+        if k.step is not None:
+            raise ValueError("ChainedQuerySets can't be sliced with a step")
+        if self._result_cache is not None:
+            return [obj for results in self._result_cache
+                    for obj in results][k]
+        start = k.start or 0
+        stop = self.count() if k.stop is None else k.stop
+        results = []
+        for queryset, count in zip(self.querysets, self._get_counts()):
+            if start < count and stop > 0:
+                results.extend(queryset[max(start, 0):min(stop, count)])
+            start -= count
+            stop -= count
+        return results
+
+    def __repr__(self):
+        return repr(list(self))
 
 
 class DecisionManager(models.Manager):
 
-    def order_by_case_insensitive(self, sort_field, sort_order):
+    def order_by_case_insensitive(self, sort_field, sort_order, **filters):
+        queryset = super(DecisionManager, self).get_query_set()\
+            .filter(**filters)
+        if has_case_insensitive_collation(self.model, sort_field):
+            return queryset.order_by(sort_order + sort_field,
+                                     sort_order + 'id')
         #Django does not yet have case insensitive ordering it is left to db https://code.djangoproject.com/ticket/6498
-        return super(DecisionManager, self).get_query_set()\
-            .extra(select={'lower': "lower(" + sort_field + ")"}).order_by(sort_order + 'lower')
+        return queryset.extra(select={'lower': "lower(" + sort_field + ")"})\
+            .order_by(sort_order + 'lower', sort_order + 'id')
 
-    def order_by_count(self, sort_field, sort_order):
-        return super(DecisionManager, self).get_query_set()\
-            .annotate(count=Count(sort_field)).order_by(sort_order + 'count')
+    def order_by_count(self, sort_field, sort_order, **filters):
+        # Counts are stored on the decision in <sort_field>_count columns
+        return super(DecisionManager, self).get_query_set().filter(**filters)\
+            .order_by(sort_order + sort_field + '_count', sort_order + 'id')
 
-    def order_null_last(self, field):
-        return super(DecisionManager, self).get_query_set()\
-            .extra(select={'has_field': "CASE WHEN " + field + " IS NULL THEN 1 ELSE 0 END"}).order_by('has_field', field)
+    def order_null_last(self, field, **filters):
+        """
+        Orders by a field with any null values last. Rather than ordering on
+        a CASE expression, the rows with and without a value are fetched by
+        separate queries, each of which can be read in order from an index.
+        """
+        queryset = super(DecisionManager, self).get_query_set()\
+            .filter(**filters)
+        field_name = field.lstrip('-')
+        sort_order = field[:-len(field_name)]
+        if not self.model._meta.get_field(field_name).null:
+            return queryset.order_by(field, sort_order + 'id')
+        return ChainedQuerySets(
+            queryset.filter(**{field_name + '__isnull': False})
+                .order_by(field, sort_order + 'id'),
+            queryset.filter(**{field_name + '__isnull': True})
+                .order_by(sort_order + 'id'))
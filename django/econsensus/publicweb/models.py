@@ -1,11 +1,13 @@
 # pylint: disable=E1102
 # config import is unused but required here for livesettings
 import config  # pylint: disable=W0611
+import base64
+import cPickle as pickle
 import re
 
 from notification import models as notification
 
-from django.db import models
+from django.db import models, router
 from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _, ugettext_noop
 from django.contrib.auth.models import User
@@ -30,11 +32,12 @@ from south.modelsinspector import add_introspection_rules
 from signals.management import (DECISION_CHANGE, MINOR_CHANGE, DECISION_NEW,
     FEEDBACK_NEW, FEEDBACK_CHANGE, COMMENT_NEW, DECISION_STATUS_CHANGE)
 from publicweb.observation_manager import ObservationManager
-# The NotificationSettings and OrganizationSettings models were moved to a
-# separate file to prevent circular imports. They need to be here or django
-# won't detect them.
+# The NotificationSettings, OrganizationSettings, NotificationJob and
+# DigestEntry models were moved to a separate file to prevent circular imports. They need to be
+# here or django won't detect them.
 from publicweb.extra_models import (STANDARD_SENDING_HEADERS,
-    NotificationSettings, MINOR_CHANGES_NOTIFICATIONS)  # pylint: disable=W0611
+    NotificationSettings, MINOR_CHANGES_NOTIFICATIONS,
+    NotificationJob, DigestEntry, ClaimableJob)  # pylint: disable=W0611
 from django.dispatch.dispatcher import receiver
 from django.contrib.comments.models import Comment
 from django.contrib.comments.signals import comment_was_posted
@@ -99,6 +102,17 @@ class Decision(models.Model):
     creation = models.DateField(null=True, auto_now_add=True,
         verbose_name=_('Creation'))
 
+    # Feedback counters, kept up to date by the Feedback signal handlers
+    feedback_count = models.IntegerField(default=0, editable=False)
+    unresolved_feedback_count = models.IntegerField(default=0,
+        editable=False)
+    question_count = models.IntegerField(default=0, editable=False)
+    danger_count = models.IntegerField(default=0, editable=False)
+    concerns_count = models.IntegerField(default=0, editable=False)
+    consent_count = models.IntegerField(default=0, editable=False)
+    # Of feedback with the "comment" rating, not of comments on feedback
+    comment_feedback_count = models.IntegerField(default=0, editable=False)
+
     objects = DecisionManager()
 
     # Fields that'll trigger last_modified update upon change
@@ -106,31 +120,93 @@ class Decision(models.Model):
               'expiry_date', 'deadline', 'archived_date', 'budget', 'people',
               'meeting_people', 'excerpt', 'creation')
 
+    # Fields whose values as loaded are kept to tell what a save changes
+    SNAPSHOT_FIELDS = TRIGGER_FIELDS + ('status', 'organization')
+
+    FEEDBACK_COUNT_FIELDS = ('feedback_count', 'unresolved_feedback_count',
+              'question_count', 'danger_count', 'concerns_count',
+              'consent_count', 'comment_feedback_count')
+
+    # The counter of each rating of feedback
+    RATING_COUNT_FIELDS = {
+        'question': 'question_count',
+        'danger': 'danger_count',
+        'concerns': 'concerns_count',
+        'consent': 'consent_count',
+        'comment': 'comment_feedback_count',
+    }
+
     def __init__(self, *args, **kwargs):
         # Unpersisted flag for suppressing notifications at save time
         self.minor_edit = False
 
         super(Decision, self).__init__(*args, **kwargs)
+        self._take_snapshot()
 
     # methods
     def unresolvedfeedback(self):
-        answer = _("No")
-        linked_feedback = self.feedback_set.all()
-        for thisfeedback in linked_feedback:
-            if (not thisfeedback.resolved):
-
-                answer = _("Yes")
-                break
-
-        return answer
+        if self.unresolved_feedback_count:
+            return _("Yes")
+        return _("No")
 
     unresolvedfeedback.short_description = _("Unresolved Feedback")
 
     def feedbackcount(self):
-        return self.feedback_set.all().count()
+        return self.feedback_count
 
     feedbackcount.short_description = _("Feedback")
 
+    @classmethod
+    def count_feedback(cls, decision_id):
+        """
+        Counts the feedback on a decision with a single query, returning the
+        values of the feedback counter fields.
+        """
+        counts = dict((field, 0) for field in cls.FEEDBACK_COUNT_FIELDS)
+        rows = Feedback.objects.filter(decision=decision_id)\
+            .values('rating', 'resolved').annotate(count=Count('id'))
+        for row in rows:
+            counts['feedback_count'] += row['count']
+            if not row['resolved']:
+                counts['unresolved_feedback_count'] += row['count']
+            rating_name = Feedback.rating_names[row['rating']]
+            counts[cls.RATING_COUNT_FIELDS[rating_name]] += row['count']
+        return counts
+
+    def recount_feedback(self):
+        """
+        Sets the feedback counters from the decision's current feedback,
+        storing them (and only them) straight away.
+        """
+        counts = self.count_feedback(self.id)
+        Decision.objects.filter(id=self.id).update(**counts)
+        for field, value in counts.items():
+            setattr(self, field, value)
+
+    def _save_without_counters(self, using=None):
+        """
+        Saves an existing decision leaving the feedback counters out of the
+        UPDATE, so that it can't overwrite counts stored by recount_feedback
+        since this instance was loaded. Sends pre_save and post_save as a
+        full save does, which the search index and summary cache rely on.
+        Returns False if the row wasn't there to update.
+        """
+        using = using or router.db_for_write(Decision, instance=self)
+        models.signals.pre_save.send(sender=Decision, instance=self,
+            raw=False, using=using)
+        values = dict((field.name, field.pre_save(self, False))
+                      for field in self._meta.local_fields
+                      if not field.primary_key
+                      and field.name not in self.FEEDBACK_COUNT_FIELDS)
+        if not Decision.objects.using(using).filter(id=self.id)\
+                .update(**values):
+            return False
+        self._state.db = using
+        self._state.adding = False
+        models.signals.post_save.send(sender=Decision, instance=self,
+            created=False, raw=False, using=using)
+        return True
+
     def _get_excerpt(self):
         return get_excerpt(self.description)
 
@@ -154,12 +230,8 @@ class Decision(models.Model):
         return re.sub('\w+@', "%s@" % self.organization.slug, default_from_email)
 
     def get_feedback_statistics(self):
-        statistics = dict([(unicode(x), 0) for x in Feedback.rating_names])
-        raw_data = self.feedback_set.values('rating').annotate(Count('rating'))
-        for x in raw_data:
-            key = unicode(Feedback.rating_names[x['rating']])
-            statistics[key] = x['rating__count']
-        return statistics
+        return dict([(unicode(x), getattr(self, self.RATING_COUNT_FIELDS[x]))
+                     for x in Feedback.rating_names])
 
     def get_message_id(self):
         """
@@ -172,7 +244,7 @@ class Decision(models.Model):
         headers.update(STANDARD_SENDING_HEADERS)
         org_users = self.organization.users.all()
         observation_manager = ObservationManager()
-        observation_manager.send_notifications(org_users, self, notification_type, {"observed": self}, headers=headers, from_email=self.get_email())
+        observation_manager.send_notifications(org_users, self, notification_type, {"observed": self}, headers=headers, from_email=self.get_email(), queue=True)
 
     def _send_minor_change_notifications(self):
         self._send_change_notifications(MINOR_CHANGE)
@@ -180,10 +252,34 @@ class Decision(models.Model):
     def _send_major_change_notifications(self):
         self._send_change_notifications(DECISION_CHANGE)
 
-    def _is_same(self, other):
+    def _take_snapshot(self):
+        """
+        Keeps the values of the SNAPSHOT_FIELDS, as they are in the database,
+        to compare with when the decision is saved. Deferred fields are
+        left out rather than loaded.
+        """
+        self._snapshot = {}
+        for name in self.SNAPSHOT_FIELDS:
+            attname = self._meta.get_field(name).attname
+            if attname in self.__dict__:
+                self._snapshot[name] = self.__dict__[attname]
+
+    def _get_snapshot(self):
+        """
+        Returns the snapshot, with the values of any fields that were
+        deferred when the decision was loaded fetched from the database.
+        """
+        missing = [name for name in self.SNAPSHOT_FIELDS
+                   if name not in self._snapshot]
+        if missing:
+            self._snapshot.update(
+                self.__class__.objects.values(*missing).get(id=self.id))
+        return self._snapshot
+
+    def _is_same(self, snapshot):
         for field in self.TRIGGER_FIELDS:
             my_field = getattr(self, field)
-            other_field = getattr(other, field)
+            other_field = snapshot[field]
             if (my_field != other_field
                 and not (my_field == u'' and other_field is None)):
                 return False
@@ -195,12 +291,12 @@ class Decision(models.Model):
     def save(self, *args, **kwargs):
         self.excerpt = self._get_excerpt()
         if self.id:
-            prev = self.__class__.objects.get(id=self.id)
-            if prev.organization.id != self.organization.id:
+            prev = self._get_snapshot()
+            if prev['organization'] != self.organization_id:
                 self.watchers.all().delete()
 
             notification_sent = False
-            if self.status != prev.status:
+            if self.status != prev['status']:
                 self._send_change_notifications(DECISION_STATUS_CHANGE)
                 self._update_last_modified()
                 notification_sent = True
@@ -212,7 +308,10 @@ class Decision(models.Model):
                     self._send_minor_change_notifications()
                 self._update_last_modified()
 
-        super(Decision, self).save(*args, **kwargs)
+        if not (self.id and not kwargs.get('force_insert')
+                and self._save_without_counters(kwargs.get('using'))):
+            super(Decision, self).save(*args, **kwargs)
+        self._take_snapshot()
 
     def note_external_modification(self):
         """
@@ -221,8 +320,9 @@ class Decision(models.Model):
         "last modified" date.
         """
         self._update_last_modified()
-        # Go to superclass to avoid sending email notifications
-        super(Decision, self).save()
+        # Bypass save() to avoid sending email notifications
+        if not self._save_without_counters():
+            super(Decision, self).save()
 
 
 class Feedback(models.Model):
@@ -278,6 +378,74 @@ class Feedback(models.Model):
         return "<feedback-%s@%s>" % (self.id, Site.objects.get_current().domain)
 
 
+class ExportJob(ClaimableJob):
+    """
+    A request for an organization's decision data export to be generated
+    in the background by the process_export_jobs management command.
+    The key identifies the state of the organization's data the export was
+    requested for, so a finished export can be served again for as long as
+    that data is unchanged.
+    """
+    DONE_STATUS = 'done'
+    FAILED_STATUS = 'failed'
+
+    STATUS_CHOICES = (
+                  (ClaimableJob.PENDING_STATUS, _('pending')),
+                  (ClaimableJob.RUNNING_STATUS, _('running')),
+                  (DONE_STATUS, _('done')),
+                  (FAILED_STATUS, _('failed')),
+                  )
+
+    organization = models.ForeignKey(Organization)
+    key = models.CharField(max_length=40)
+    status = models.CharField(choices=STATUS_CHOICES,
+                              default=ClaimableJob.PENDING_STATUS,
+                              max_length=10)
+    requested = models.DateTimeField(auto_now_add=True)
+    completed = models.DateTimeField(null=True, blank=True)
+    file_name = models.CharField(max_length=255, blank=True)
+
+    class Meta:
+        unique_together = ('organization', 'key')
+
+
+class SpooledEmail(ClaimableJob):
+    """
+    An email waiting to be sent by the send_spooled_mail management command,
+    stored by the SpoolEmailBackend (see mail_spool.py). The message is
+    kept pickled, so it is sent exactly as it was built. Messages that
+    can't be sent are retried, later each time, until they fail for good.
+    Sent messages are deleted.
+    """
+    RUNNING_STATUS = 'sending'
+    FAILED_STATUS = 'failed'
+
+    STATUS_CHOICES = (
+                  (ClaimableJob.PENDING_STATUS, _('pending')),
+                  (RUNNING_STATUS, _('sending')),
+                  (FAILED_STATUS, _('failed')),
+                  )
+
+    message_data = models.TextField()
+    status = models.CharField(choices=STATUS_CHOICES,
+                              default=ClaimableJob.PENDING_STATUS,
+                              max_length=10,
+                              db_index=True)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    def _get_message(self):
+        return pickle.loads(base64.b64decode(self.message_data))
+
+    def _set_message(self, message):
+        self.message_data = base64.b64encode(
+            pickle.dumps(message, pickle.HIGHEST_PROTOCOL))
+
+    message = property(_get_message, _set_message)
+
+
 def send_decision_notifications(decision, users):
     headers = {'Message-ID' : decision.get_message_id()}
     headers.update(STANDARD_SENDING_HEADERS)
@@ -285,7 +453,7 @@ def send_decision_notifications(decision, users):
     observation_manager = ObservationManager()
     observation_manager.send_notifications(
                     users, decision, DECISION_NEW, extra_context, headers,
-                    from_email=decision.get_email())
+                    from_email=decision.get_email(), queue=True)
 
 # TODO: Test this
 def send_comment_notifications(comment, users):
@@ -298,7 +466,7 @@ def send_comment_notifications(comment, users):
     observation_manager = ObservationManager()
 
     extra_context = dict({"observed": comment})
-    observation_manager.send_notifications(users, comment, COMMENT_NEW, extra_context, headers, from_email=comment.content_object.decision.get_email())
+    observation_manager.send_notifications(users, comment, COMMENT_NEW, extra_context, headers, from_email=comment.content_object.decision.get_email(), queue=True)
 
 
 def additional_message_required(user, decision, level):
@@ -334,7 +502,7 @@ def decision_signal_handler(sender, **kwargs):
         active_users = instance.organization.users.filter(is_active=True)
         extra_context = {"observed": instance}
         observation_manager = ObservationManager()
-        observation_manager.send_notifications(active_users, instance, DECISION_NEW, extra_context, headers, from_email=instance.get_email())
+        observation_manager.send_notifications(active_users, instance, DECISION_NEW, extra_context, headers, from_email=instance.get_email(), queue=True)
 
 
 @receiver(models.signals.post_save, sender=Feedback, dispatch_uid="publicweb.models.feedback_signal_handler")
@@ -354,6 +522,7 @@ def feedback_signal_handler(sender, **kwargs):
     }
     headers.update(STANDARD_SENDING_HEADERS)
 
+    instance.decision.recount_feedback()
     instance.decision.note_external_modification()
 
     observation_manager = ObservationManager()
@@ -362,13 +531,26 @@ def feedback_signal_handler(sender, **kwargs):
 
     if kwargs.get('created', True):
         # All watchers of parent get notified of new feedback.
-        observation_manager.send_notifications(org_users, instance, FEEDBACK_NEW, extra_context, headers, from_email=instance.decision.get_email())
+        observation_manager.send_notifications(org_users, instance, FEEDBACK_NEW, extra_context, headers, from_email=instance.decision.get_email(), queue=True)
     else:
         # An edit by someone other than the author never counts as minor
         if instance.author != instance.editor or not instance.minor_edit:
-            observation_manager.send_notifications(org_users, instance, FEEDBACK_CHANGE, extra_context, headers, from_email=instance.decision.get_email())
+            observation_manager.send_notifications(org_users, instance, FEEDBACK_CHANGE, extra_context, headers, from_email=instance.decision.get_email(), queue=True)
         else:
-            observation_manager.send_notifications(org_users, instance, MINOR_CHANGE, extra_context, headers, from_email=instance.decision.get_email())
+            observation_manager.send_notifications(org_users, instance, MINOR_CHANGE, extra_context, headers, from_email=instance.decision.get_email(), queue=True)
+
+
+@receiver(models.signals.post_delete, sender=Feedback, dispatch_uid="publicweb.models.feedback_delete_signal_handler")
+def feedback_delete_signal_handler(sender, **kwargs):
+    """
+    Keeps the decision's feedback counters and last_modified up to date
+    when feedback is deleted. The decision is updated in the database only,
+    as it may itself be in the middle of being deleted.
+    """
+    instance = kwargs.get('instance')
+    counts = Decision.count_feedback(instance.decision_id)
+    Decision.objects.filter(id=instance.decision_id).update(
+        last_modified=timezone.now(), **counts)
 
 
 @receiver(comment_was_posted, sender=Comment, dispatch_uid="publicweb.models.comment_posted_signal_handler")
@@ -403,10 +585,39 @@ def actionitem_signal_handler(sender, **kwargs):
         instance.origin.note_external_modification()
 
 
-# We can't register our ActionItem post-save signal handler, as importing the
+def _touch_decisions(decision_ids):
+    # In the database only, as the decisions may be in the middle of being
+    # deleted themselves
+    Decision.objects.filter(id__in=decision_ids).update(
+        last_modified=timezone.now())
+
+
+def actionitem_delete_signal_handler(sender, **kwargs):
+    """
+    Updates the "last-modified" field of a deleted action item's decision,
+    so that incremental exports pick up the deletion.
+    """
+    instance = kwargs.get('instance')
+    if instance.origin_id:
+        _touch_decisions([instance.origin_id])
+
+
+@receiver(models.signals.post_delete, sender=Comment, dispatch_uid="publicweb.models.comment_delete_signal_handler")
+def comment_delete_signal_handler(sender, **kwargs):
+    """
+    Updates the "last-modified" field of the decision of a deleted comment's
+    feedback, so that incremental exports pick up the deletion.
+    """
+    instance = kwargs.get('instance')
+    if instance.content_type.model_class() is Feedback:
+        _touch_decisions(Feedback.objects.filter(id=instance.object_pk)
+                         .values_list('decision', flat=True))
+
+
+# We can't register our ActionItem signal handlers, as importing the
 # ActionItem model in this file would result in a circular dependency. So
 # instead we listen for the ActionItem model class being defined, and register
-# the post-save signal handler when it is ready.
+# the signal handlers when it is ready.
 @receiver(models.signals.class_prepared, dispatch_uid="publicweb.models.class_prepared_signal_handler")
 def class_prepared_signal_handler(sender, **kwargs):
     if sender.__name__ == "ActionItem":
@@ -414,3 +625,11 @@ def class_prepared_signal_handler(sender, **kwargs):
                             sender=sender,
                             dispatch_uid="publicweb.models.actionitem_signal_handler")
         register(actionitem_signal_handler)
+        register = receiver(models.signals.post_delete,
+                            sender=sender,
+                            dispatch_uid="publicweb.models.actionitem_delete_signal_handler")
+        register(actionitem_delete_signal_handler)
+
+
+# Registers the handlers that keep the organization summaries up to date
+import publicweb.summary  # pylint: disable=W0611
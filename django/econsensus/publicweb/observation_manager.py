@@ -1,10 +1,47 @@
-from publicweb.extra_models import (NotificationSettings,
-    NO_NOTIFICATIONS, MAIN_ITEMS_NOTIFICATIONS_ONLY,
-    FEEDBACK_ADDED_NOTIFICATIONS, FEEDBACK_MAJOR_CHANGES)
+from django.conf import settings as django_settings
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.db import IntegrityError, transaction
+from django.utils import simplejson as json
+
+from publicweb.extra_models import (NotificationSettings, NotificationJob,
+    OrganizationSettings, DigestEntry, IMMEDIATE_DELIVERY,
+    MAIN_ITEMS_NOTIFICATIONS_ONLY, FEEDBACK_ADDED_NOTIFICATIONS,
+    FEEDBACK_MAJOR_CHANGES, MINOR_CHANGES_NOTIFICATIONS)
 from signals.management import (DECISION_NEW, DECISION_STATUS_CHANGE,
     FEEDBACK_CHANGE, DECISION_CHANGE, FEEDBACK_NEW, COMMENT_NEW,
     COMMENT_CHANGE, MINOR_CHANGE)
-from notification import models as notification
+from custom_notification.utils import send_to_all
+
+# The lowest notification level at which each type of notification is sent.
+# Levels are cumulative: each one gets everything the levels below it do.
+NOTIFICATION_THRESHOLDS = {
+    DECISION_NEW: MAIN_ITEMS_NOTIFICATIONS_ONLY,
+    DECISION_STATUS_CHANGE: MAIN_ITEMS_NOTIFICATIONS_ONLY,
+    DECISION_CHANGE: FEEDBACK_ADDED_NOTIFICATIONS,
+    FEEDBACK_NEW: FEEDBACK_ADDED_NOTIFICATIONS,
+    FEEDBACK_CHANGE: FEEDBACK_MAJOR_CHANGES,
+    COMMENT_NEW: FEEDBACK_MAJOR_CHANGES,
+    COMMENT_CHANGE: FEEDBACK_MAJOR_CHANGES,
+    MINOR_CHANGE: MINOR_CHANGES_NOTIFICATIONS,
+}
+
+# Notifications held back for users who get digests. New items and status
+# changes are always sent straight away.
+DIGEST_NOTICE_TYPES = (DECISION_CHANGE, FEEDBACK_NEW, FEEDBACK_CHANGE,
+                       COMMENT_NEW, COMMENT_CHANGE, MINOR_CHANGE)
+
+
+def get_decision(item):
+    """
+    Returns the decision an item (a decision, feedback or a comment on
+    feedback) belongs to.
+    """
+    if hasattr(item, 'content_object'):
+        item = item.content_object
+    if hasattr(item, 'decision'):
+        item = item.decision
+    return item
 
 
 class ObservationManager(object):
@@ -13,58 +50,156 @@ class ObservationManager(object):
     def __init__(self):
         self.recipient_list = set()
 
-    def _get_decision(self, item):
-        if hasattr(item, 'content_object'):
-            item = item.content_object
-        if hasattr(item, 'decision'):
-            item = item.decision
-        return item
-
     def _add_recipient(self, user):
         self.recipient_list.add(user)
 
     def _get_organization(self, item):
-        item = self._get_decision(item)
+        item = get_decision(item)
         return item.organization
 
-    def get_settings(self, user, organization):
-        settings, _ = NotificationSettings.objects.get_or_create(
-              user=user, organization=organization
-        )
-        return settings
-
-    def update_observers(self, settings, notification_type):
-        notifications = {
-             NO_NOTIFICATIONS: (DECISION_NEW, DECISION_STATUS_CHANGE),
-             MAIN_ITEMS_NOTIFICATIONS_ONLY: (DECISION_CHANGE, FEEDBACK_NEW),
-             FEEDBACK_ADDED_NOTIFICATIONS: (
-                    FEEDBACK_CHANGE, COMMENT_NEW, COMMENT_CHANGE
-             ),
-             FEEDBACK_MAJOR_CHANGES: (MINOR_CHANGE,)
-        }
-        for key, types in notifications.items():
-            if settings.notification_level > key and notification_type in types:
-                self._add_recipient(settings.user)
+    def get_default_level(self, organization):
+        levels = OrganizationSettings.objects.filter(
+            organization=organization
+        ).values_list('default_notification_level', flat=True)
+        if levels:
+            return levels[0]
+        return NotificationSettings._meta.get_field(
+            'notification_level').default
+
+    def create_missing_settings(self, users, organization):
+        """
+        Creates the notification settings in the organization, with its
+        default notification level, of any of the users who have none.
+        """
+        existing = set(NotificationSettings.objects.filter(
+            organization=organization, user__in=[user.pk for user in users]
+        ).values_list('user', flat=True))
+        missing = [user for user in users if user.pk not in existing]
+        if not missing:
+            return
+        level = self.get_default_level(organization)
+        sid = transaction.savepoint()
+        try:
+            NotificationSettings.objects.bulk_create([
+                NotificationSettings(user=user, organization=organization,
+                                     notification_level=level)
+                for user in missing])
+            transaction.savepoint_commit(sid)
+        except IntegrityError:
+            # Some were created meanwhile, by another request
+            transaction.savepoint_rollback(sid)
+            for user in missing:
+                NotificationSettings.objects.get_or_create(
+                    user=user, organization=organization,
+                    defaults={'notification_level': level})
+
+    def get_notified_users(self, users, organization, notification_type):
+        """
+        Returns those of the users whose notification level in the
+        organization is high enough for this type of notification. They
+        are picked out by the database rather than by loading everyone's
+        settings.
+        """
+        threshold = NOTIFICATION_THRESHOLDS.get(notification_type)
+        users = dict((user.pk, user) for user in users)
+        if threshold is None or not users:
+            return []
+        self.create_missing_settings(users.values(), organization)
+        user_ids = NotificationSettings.objects.filter(
+            organization=organization, user__in=users.keys(),
+            notification_level__gte=threshold
+        ).values_list('user', flat=True)
+        return [users[user_id] for user_id in user_ids]
+
+    def hold_for_digests(self, item, organization, notification_type):
+        """
+        Takes the recipients who get this type of notification in digests
+        out of the recipient list, adding a DigestEntry for each of them
+        instead, to be sent by the send_digests command.
+        """
+        if (notification_type not in DIGEST_NOTICE_TYPES or
+                not self.recipient_list):
+            return
+        frequencies = dict(NotificationSettings.objects.filter(
+            organization=organization,
+            user__in=[user.pk for user in self.recipient_list]
+        ).exclude(digest_frequency=IMMEDIATE_DELIVERY
+        ).values_list('user', 'digest_frequency'))
+        if not frequencies:
+            return
+        content_type = ContentType.objects.get_for_model(item)
+        entries = []
+        for user in list(self.recipient_list):
+            if user.pk in frequencies:
+                self.recipient_list.discard(user)
+                entries.append(DigestEntry(user=user,
+                                           organization=organization,
+                                           frequency=frequencies[user.pk],
+                                           notice_type=notification_type,
+                                           content_type=content_type,
+                                           object_id=item.pk))
+        DigestEntry.objects.bulk_create(entries)
 
     def include_watchers(self, item):
-        item = self._get_decision(item)
+        item = get_decision(item)
         watchers = [watcher.user for watcher in item.watchers.all()]
         self.recipient_list.update(watchers)
 
     def send_notifications(self, recipients, item, notification_type,
-                           extra_context, headers, from_email):
+                           extra_context, headers, from_email, queue=False):
+        """
+        Notifies those of the recipients (and the item's watchers) whose
+        settings ask for this type of notification. If queue is set and so
+        is the QUEUE_NOTIFICATIONS setting, the notifications are queued to
+        be sent by the process_notifications command instead. A queued job
+        only keeps the item, so callers may only set queue when the extra
+        context is just {"observed": item}.
+        """
+        if queue and getattr(django_settings, 'QUEUE_NOTIFICATIONS', False):
+            self.queue_notifications(recipients, item, notification_type,
+                                     headers, from_email)
+        else:
+            self.deliver_notifications(recipients, item, notification_type,
+                                       extra_context, headers, from_email)
+
+    def queue_notifications(self, recipients, item, notification_type,
+                            headers, from_email):
+        return NotificationJob.objects.create(
+            notice_type=notification_type,
+            content_type=ContentType.objects.get_for_model(item),
+            object_id=item.pk,
+            recipients=json.dumps([user.pk for user in recipients]),
+            headers=json.dumps(headers),
+            from_email=from_email)
+
+    def deliver_notifications(self, recipients, item, notification_type,
+                              extra_context, headers, from_email):
         if notification_type != MINOR_CHANGE:
             self.include_watchers(item)
         organization = self._get_organization(item)
 
-        for recipient in recipients:
-            settings = self.get_settings(recipient, organization)
-            self.update_observers(settings, notification_type)
+        self.recipient_list.update(self.get_notified_users(
+            recipients, organization, notification_type))
+        self.hold_for_digests(item, organization, notification_type)
 
-        notification.send(
-            list(self.recipient_list),
+        send_to_all(
+            self.recipient_list,
             notification_type,
             extra_context,
             headers,
             from_email=from_email
         )
+
+
+def send_queued_notifications(job):
+    """
+    Sends the notifications of a claimed NotificationJob, unless its item
+    has been deleted since.
+    """
+    item = job.item
+    if item is None:
+        return
+    recipients = User.objects.filter(id__in=json.loads(job.recipients))
+    ObservationManager().deliver_notifications(recipients, item,
+        job.notice_type, {"observed": item}, json.loads(job.headers),
+        job.from_email)
@@ -0,0 +1,206 @@
+"""
+Keyset (cursor) pagination for the decision and action item lists.
+
+Rather than counting the whole list and skipping OFFSET rows to reach a
+page, each page is fetched with a WHERE clause on the sort column and id
+of the item next to it, so a page deep in a large archive costs the same
+as the first one.
+"""
+import base64
+import datetime
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.http import Http404
+from django.utils import simplejson as json
+
+from publicweb.managers import has_case_insensitive_collation
+
+
+class SortKey(object):
+    """
+    Order of a list: by a column, compared in lower case if lower is set,
+    then by id. Null values of the column come last in either direction.
+    """
+    def __init__(self, model, field_name, descending, lower=False):
+        self.model = model
+        self.field = model._meta.get_field(field_name)
+        self.descending = descending
+        self.lower = lower and not has_case_insensitive_collation(model,
+                                                                  field_name)
+
+    def _column(self):
+        qn = connection.ops.quote_name
+        return '%s.%s' % (qn(self.model._meta.db_table),
+                          qn(self.field.column))
+
+    def _descending(self, reverse):
+        return self.descending != reverse
+
+    def value(self, obj):
+        value = getattr(obj, self.field.attname)
+        if self.lower and value is not None:
+            value = value.lower()
+        return value
+
+    def segments(self, queryset, reverse=False):
+        """
+        Returns the list in order (or in reverse) as a list of querysets to
+        be read one after the other: the rows with a value for the column
+        and, if it is nullable, those without one. Unlike ordering on a
+        CASE expression, each can be read in order from an index.
+        """
+        prefix = '-' if self._descending(reverse) else ''
+        if self.lower:
+            valued = queryset.extra(
+                select={'lower': 'lower(%s)' % self._column()}
+            ).order_by(prefix + 'lower', prefix + 'pk')
+        else:
+            valued = queryset.order_by(prefix + self.field.attname,
+                                       prefix + 'pk')
+        if not self.field.null:
+            return [valued]
+        segments = [
+            valued.filter(**{self.field.attname + '__isnull': False}),
+            queryset.filter(**{self.field.attname + '__isnull': True})
+                .order_by(prefix + 'pk')]
+        if reverse:
+            segments.reverse()
+        return segments
+
+    def filter_segments(self, segments, value, pk, reverse=False):
+        """
+        Limits the segments of a list to the rows after (or, if reverse is
+        set, before) the row with the given sort value and primary key.
+        """
+        op = 'lt' if self._descending(reverse) else 'gt'
+        index = 0
+        if self.field.null:
+            index = int((value is None) != reverse)
+        segment = segments[index]
+        if value is None:
+            segment = segment.filter(**{'pk__' + op: pk})
+        elif self.lower:
+            qn = connection.ops.quote_name
+            sql = ('(lower({0}) {1} %s OR (lower({0}) = %s AND {2}.{3} {1} %s))'
+                   .format(self._column(), '<' if op == 'lt' else '>',
+                           qn(self.model._meta.db_table),
+                           qn(self.model._meta.pk.column)))
+            segment = segment.extra(where=[sql], params=[value, value, pk])
+        else:
+            segment = segment.filter(
+                Q(**{self.field.attname + '__' + op: value}) |
+                Q(**{self.field.attname: value, 'pk__' + op: pk}))
+        return [segment] + segments[index + 1:]
+
+    def get_cursor(self, obj):
+        value = self.value(obj)
+        if isinstance(value, datetime.date):
+            value = value.isoformat()
+        return base64.urlsafe_b64encode(json.dumps([value, obj.pk]))
+
+    def parse_cursor(self, cursor):
+        """
+        Returns the sort value and primary key encoded in a cursor. Raises
+        ValueError if the cursor is invalid.
+        """
+        try:
+            value, pk = json.loads(base64.urlsafe_b64decode(str(cursor)))
+            if value is not None and not self.lower:
+                value = self.field.to_python(value)
+            return value, int(pk)
+        except Exception:
+            raise ValueError("Invalid cursor '%s'" % cursor)
+
+
+class CursorPage(object):
+    """
+    A page of a keyset paginated list. It has the parts of the Page
+    interface that don't need the size of the whole list.
+    """
+    def __init__(self, object_list, sort_key, has_next, has_previous):
+        self.object_list = object_list
+        self.sort_key = sort_key
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    def next_cursor(self):
+        return self.sort_key.get_cursor(self.object_list[-1])
+
+    def previous_cursor(self):
+        return self.sort_key.get_cursor(self.object_list[0])
+
+
+def _fetch(segments, count):
+    objects = []
+    for segment in segments:
+        if len(objects) >= count:
+            break
+        objects.extend(segment[:count - len(objects)])
+    return objects
+
+
+def get_cursor_page(queryset, sort_key, page_size, after=None, before=None):
+    """
+    Returns the page of page_size objects following the after cursor,
+    preceding the before cursor, or at the start of the list.
+    """
+    if before:
+        segments = sort_key.segments(queryset, reverse=True)
+        value, pk = sort_key.parse_cursor(before)
+        segments = sort_key.filter_segments(segments, value, pk, reverse=True)
+        object_list = _fetch(segments, page_size + 1)
+        has_previous = len(object_list) > page_size
+        object_list = object_list[:page_size]
+        object_list.reverse()
+        return CursorPage(object_list, sort_key, True, has_previous)
+
+    segments = sort_key.segments(queryset)
+    if after:
+        value, pk = sort_key.parse_cursor(after)
+        segments = sort_key.filter_segments(segments, value, pk)
+    object_list = _fetch(segments, page_size + 1)
+    has_next = len(object_list) > page_size
+    return CursorPage(object_list[:page_size], sort_key, has_next,
+                      bool(after))
+
+
+class CursorPaginationMixin(object):
+    """
+    Pages through a sorted ListView with cursors rather than page numbers
+    when the CURSOR_PAGINATION setting is on or the request has an 'after'
+    or 'before' cursor. The view's get_sort_key() gives the SortKey for
+    its current sort, or None if the list can't be paginated by cursor.
+    """
+    def use_cursor_pagination(self):
+        return (getattr(settings, 'CURSOR_PAGINATION', False) or
+                'after' in self.request.GET or
+                'before' in self.request.GET)
+
+    def paginate_queryset(self, queryset, page_size):
+        sort_key = None
+        if self.use_cursor_pagination():
+            sort_key = self.get_sort_key()
+        if sort_key is None:
+            return super(CursorPaginationMixin, self).paginate_queryset(
+                queryset, page_size)
+        try:
+            page = get_cursor_page(queryset, sort_key, int(page_size),
+                                   after=self.request.GET.get('after'),
+                                   before=self.request.GET.get('before'))
+        except ValueError:
+            raise Http404
+        return (None, page, page.object_list, page.has_other_pages())
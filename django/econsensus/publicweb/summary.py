@@ -0,0 +1,95 @@
+"""
+Summary of what there is in an organization: the number of items in each
+status, of open action items and of unresolved feedback.
+
+The summary is worked out with one aggregate query over the decisions
+(using their stored feedback counters) and one count of action items, then
+cached until something in the organization changes.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Sum, get_model
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch.dispatcher import receiver
+
+from publicweb.models import Decision, Feedback
+
+DEFAULT_SUMMARY_CACHE_TIMEOUT = 60 * 60
+
+
+def get_summary_cache_key(organization_id):
+    return 'publicweb.summary.%s' % organization_id
+
+
+def get_organization_summary(organization):
+    """
+    Returns a dict of the number of decisions in each status, open action
+    items ('actionitems') and unresolved feedback ('unresolved_feedback')
+    in the organization.
+    """
+    return get_summary_by_id(organization.id)
+
+
+def get_summary_by_id(organization_id):
+    """
+    Like get_organization_summary, for the organization with this id.
+    """
+    key = get_summary_cache_key(organization_id)
+    summary = cache.get(key)
+    if summary is None:
+        summary = dict((status, 0) for status, name in Decision.STATUS_CHOICES)
+        summary['unresolved_feedback'] = 0
+        rows = Decision.objects.filter(organization=organization_id)\
+            .values('status').order_by()\
+            .annotate(count=Count('id'),
+                      unresolved=Sum('unresolved_feedback_count'))
+        for row in rows:
+            summary[row['status']] = row['count']
+            summary['unresolved_feedback'] += row['unresolved'] or 0
+        # Looked up here as importing it would be circular, see models.py
+        ActionItem = get_model('actionitems', 'ActionItem')
+        summary['actionitems'] = ActionItem.objects.filter(
+            origin__organization=organization_id, done=False).count()
+        cache.set(key, summary, getattr(settings,
+            'ORGANIZATION_SUMMARY_CACHE_TIMEOUT',
+            DEFAULT_SUMMARY_CACHE_TIMEOUT))
+    return summary
+
+
+def invalidate_organization_summary(organization_id):
+    cache.delete(get_summary_cache_key(organization_id))
+
+
+def _invalidate_for_decision(decision_id):
+    organization_ids = Decision.objects.filter(id=decision_id)\
+        .values_list('organization', flat=True)
+    for organization_id in organization_ids:
+        invalidate_organization_summary(organization_id)
+
+
+# Saving feedback or an action item saves its decision too, so only
+# deleting them needs handlers of their own
+@receiver(post_save, sender=Decision, dispatch_uid="publicweb.summary.decision_changed")
+@receiver(post_delete, sender=Decision, dispatch_uid="publicweb.summary.decision_deleted")
+def decision_changed(sender, **kwargs):
+    invalidate_organization_summary(kwargs.get('instance').organization_id)
+
+
+@receiver(pre_save, sender=Decision, dispatch_uid="publicweb.summary.decision_moving")
+def decision_moving(sender, **kwargs):
+    # A decision may be moving to another organization, in which case the
+    # one it is leaving needs a new summary too
+    instance = kwargs.get('instance')
+    if instance.id:
+        _invalidate_for_decision(instance.id)
+
+
+@receiver(post_delete, sender=Feedback, dispatch_uid="publicweb.summary.feedback_deleted")
+def feedback_deleted(sender, **kwargs):
+    _invalidate_for_decision(kwargs.get('instance').decision_id)
+
+
+@receiver(post_delete, dispatch_uid="publicweb.summary.actionitem_deleted")
+def actionitem_deleted(sender, **kwargs):
+    if sender is get_model('actionitems', 'ActionItem'):
+        _invalidate_for_decision(kwargs.get('instance').origin_id)
@@ -3,6 +3,7 @@ from django import template
 from publicweb.models import Feedback
 import publicweb.utils
 from actionitems.models import ActionItem
+from publicweb.summary import get_organization_summary
 
 register = template.Library()
 
@@ -35,6 +36,12 @@ def get_excerpt(value):
 def get_actionitems(decision):
     return ActionItem.objects.filter(origin=decision.id)
 
-@register.filter
-def is_watching(user, decision):
-    return user in [watcher.user for watcher in decision.watchers.all()]
+@register.assignment_tag
+def organization_summary(organization, user):
+    """
+    Counts of the items in an organization, see publicweb.summary, or None
+    if the user isn't a member of it.
+    """
+    if not organization.is_member(user):
+        return None
+    return get_organization_summary(organization)
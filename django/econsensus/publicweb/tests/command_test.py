@@ -3,23 +3,34 @@
 #Test commands that have been added to manage.py
 import poplib
 import logging
+from datetime import timedelta
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 
 from django.core import management, mail
+from django.db import connection
+from django.core.mail import EmailMessage, get_connection
 from django.utils import timezone
 from django.contrib.auth.models import User
 from django.contrib.sites.models import Site
 from django.contrib.comments.models import Comment
 from django.contrib.contenttypes.models import ContentType
+from django.test.utils import override_settings
 
+from notification.models import NoticeType, get_notification_setting
 from organizations.models import Organization
 
+from custom_notification.utils import get_email_medium
+
 from publicweb.tests.open_consent_test_case import EconsensusFixtureTestCase
 from publicweb.tests import dummy_poplib
-from publicweb.models import Decision, Feedback
+from publicweb.tests.smtp_sink import SMTPSink
+from publicweb.models import Decision, Feedback, SpooledEmail
 from publicweb.management.commands.process_email import is_autoreply
-from publicweb.extra_models import NotificationSettings, FEEDBACK_MAJOR_CHANGES
+from publicweb.extra_models import (NotificationSettings,
+    FEEDBACK_MAJOR_CHANGES, NotificationJob, DigestEntry, HOURLY_DIGEST,
+    MINOR_CHANGES_NOTIFICATIONS, Lease)
+from publicweb.mail_spool import send_spooled_mail, LEASE_NAME
 
 class CommandTest(EconsensusFixtureTestCase):
 
@@ -540,4 +551,187 @@ class CommandTest(EconsensusFixtureTestCase):
         msg1['To'] = '%s@econsensus.com>' % self.bettysorg.slug
         msg1['Precedence'] = 'auto_reply'
         
-        self.assertTrue(is_autoreply(msg1))
\ No newline at end of file
+        self.assertTrue(is_autoreply(msg1))
+
+    def test_recount_feedback_repairs_counters(self):
+        decision = Decision.objects.create(description='Counted',
+                                           organization=self.bettysorg)
+        Feedback.objects.create(description='Feedback', decision=decision,
+                                rating=Feedback.QUESTION_STATUS)
+        Decision.objects.filter(id=decision.id).update(feedback_count=5,
+                                                       question_count=0)
+        management.call_command('recount_feedback')
+        decision = Decision.objects.get(id=decision.id)
+        self.assertEqual(1, decision.feedback_count)
+        self.assertEqual(1, decision.question_count)
+
+    @override_settings(QUEUE_NOTIFICATIONS=True)
+    def test_process_notifications_sends_queued_notifications(self):
+        mail.outbox = []
+        Decision.objects.create(description='Queued',
+                                organization=self.bettysorg)
+        self.assertEqual([], mail.outbox)
+        self.assertEqual(1, NotificationJob.objects.count())
+        management.call_command('process_notifications')
+        self.assertTrue(mail.outbox)
+        self.assertFalse(NotificationJob.objects.exists())
+
+    @override_settings(QUEUE_NOTIFICATIONS=True)
+    def test_process_notifications_retries_abandoned_jobs(self):
+        Decision.objects.create(description='Abandoned',
+                                organization=self.bettysorg)
+        job = NotificationJob.objects.get()
+        self.assertTrue(job.claim())
+        NotificationJob.objects.filter(id=job.id).update(
+            claimed_at=timezone.now() - timedelta(hours=1))
+        mail.outbox = []
+        management.call_command('process_notifications')
+        self.assertTrue(mail.outbox)
+        self.assertFalse(NotificationJob.objects.exists())
+
+    @override_settings(QUEUE_NOTIFICATIONS=True)
+    def test_process_notifications_skips_deleted_items(self):
+        mail.outbox = []
+        Decision.objects.create(description='Deleted',
+                                organization=self.bettysorg).delete()
+        management.call_command('process_notifications')
+        self.assertEqual([], mail.outbox)
+        self.assertFalse(NotificationJob.objects.exists())
+
+    def hold_digest_entries(self):
+        decision = Decision.objects.create(description='Digested',
+                                           organization=self.bettysorg)
+        users = list(self.bettysorg.users.filter(is_active=True))
+        NotificationSettings.objects.filter(
+            organization=self.bettysorg).delete()
+        for user in users:
+            NotificationSettings.objects.create(user=user,
+                organization=self.bettysorg,
+                notification_level=MINOR_CHANGES_NOTIFICATIONS,
+                digest_frequency=HOURLY_DIGEST)
+
+        mail.outbox = []
+        Feedback.objects.create(description='First', decision=decision)
+        Feedback.objects.create(description='Second', decision=decision)
+        self.assertEqual([], mail.outbox)
+        self.assertEqual(2 * len(users), DigestEntry.objects.count())
+        return decision, users
+
+    def test_send_digests_sends_one_email_per_user(self):
+        decision, users = self.hold_digest_entries()
+
+        management.call_command('send_digests', HOURLY_DIGEST)
+        self.assertEqual(sorted(user.email for user in users),
+                         sorted(message.to[0] for message in mail.outbox))
+        self.assertIn(decision.get_absolute_url(), mail.outbox[0].body)
+        self.assertEqual(decision.get_email(), mail.outbox[0].from_email)
+        self.assertFalse(DigestEntry.objects.exists())
+
+    def test_send_digests_skips_inactive_users_and_users_without_email(self):
+        _, users = self.hold_digest_entries()
+        inactive, no_email = users[:2]
+        User.objects.filter(id=inactive.id).update(is_active=False)
+        User.objects.filter(id=no_email.id).update(email='')
+
+        management.call_command('send_digests', HOURLY_DIGEST)
+        self.assertEqual(sorted(user.email for user in users[2:]),
+                         sorted(message.to[0] for message in mail.outbox))
+        self.assertFalse(DigestEntry.objects.exists())
+
+    def test_send_digests_skips_users_who_opted_out_of_email(self):
+        _, users = self.hold_digest_entries()
+        opted_out = users[0]
+        notice_type = NoticeType.objects.get(
+            label=DigestEntry.objects.filter(user=opted_out)[0].notice_type)
+        setting = get_notification_setting(opted_out, notice_type,
+                                           get_email_medium())
+        setting.send = False
+        setting.save()
+
+        management.call_command('send_digests', HOURLY_DIGEST)
+        self.assertEqual(sorted(user.email for user in users[1:]),
+                         sorted(message.to[0] for message in mail.outbox))
+        self.assertFalse(DigestEntry.objects.exists())
+
+    def spool_emails(self, count):
+        connection = get_connection('publicweb.mail_spool.SpoolEmailBackend')
+        connection.send_messages([
+            EmailMessage('Spooled %s' % i, 'Body', 'from@example.com',
+                         ['to@example.com']) for i in range(count)])
+
+    def test_send_spooled_mail_reuses_one_connection(self):
+        sink = SMTPSink().start()
+        try:
+            with self.settings(EMAIL_HOST=sink.host, EMAIL_PORT=sink.port,
+                               EMAIL_HOST_USER='', EMAIL_USE_TLS=False,
+                               EMAIL_SPOOL_BATCH_SIZE=2):
+                self.spool_emails(3)
+                self.assertEqual(3, SpooledEmail.objects.count())
+                self.assertEqual([], sink.messages)
+                management.call_command('send_spooled_mail')
+        finally:
+            sink.stop()
+        self.assertEqual(3, len(sink.messages))
+        self.assertEqual(1, sink.connections)
+        self.assertFalse(SpooledEmail.objects.exists())
+
+    def test_send_spooled_mail_retries_later(self):
+        # Nothing is listening on the port once the sink has stopped
+        sink = SMTPSink().start()
+        sink.stop()
+        with self.settings(EMAIL_HOST=sink.host, EMAIL_PORT=sink.port,
+                           EMAIL_HOST_USER='', EMAIL_USE_TLS=False):
+            self.spool_emails(2)
+            management.call_command('send_spooled_mail')
+        first, second = SpooledEmail.objects.order_by('id')
+        self.assertEqual(SpooledEmail.PENDING_STATUS, first.status)
+        self.assertEqual(1, first.attempts)
+        self.assertGreater(first.next_attempt, timezone.now())
+        # The rest are left for the next run
+        self.assertEqual(SpooledEmail.PENDING_STATUS, second.status)
+        self.assertEqual(0, second.attempts)
+
+    def test_send_spooled_mail_leaves_spool_to_running_sender(self):
+        self.assertTrue(Lease.acquire(LEASE_NAME, 'other sender', 60))
+        self.spool_emails(1)
+        self.assertEqual(None, send_spooled_mail())
+        self.assertEqual(SpooledEmail.PENDING_STATUS,
+                         SpooledEmail.objects.get().status)
+        # Until its lease lapses
+        Lease.objects.filter(name=LEASE_NAME).update(
+            expires=timezone.now() - timedelta(seconds=1))
+        with self.settings(EMAIL_SPOOL_BACKEND=
+                           'django.core.mail.backends.locmem.EmailBackend'):
+            self.assertEqual(1, send_spooled_mail())
+        # And the lease is given up once the spool has been sent
+        self.assertTrue(Lease.acquire(LEASE_NAME, 'other sender', 60))
+
+    def test_send_spooled_mail_resends_abandoned_emails(self):
+        self.spool_emails(2)
+        abandoned, claimed = SpooledEmail.objects.order_by('id')
+        abandoned.claim()
+        SpooledEmail.objects.filter(id=abandoned.id).update(
+            claimed_at=timezone.now() - timedelta(hours=1))
+        claimed.claim()
+        mail.outbox = []
+        with self.settings(EMAIL_SPOOL_BACKEND=
+                           'django.core.mail.backends.locmem.EmailBackend'):
+            self.assertEqual(1, send_spooled_mail())
+        self.assertEqual(1, len(mail.outbox))
+        self.assertEqual([claimed], list(SpooledEmail.objects.all()))
+
+    def test_create_cache_table_creates_the_database_cache_table_once(self):
+        caches = {'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'test_cache_table'}}
+        with self.settings(CACHES=caches):
+            management.call_command('create_cache_table')
+            self.assertTrue('test_cache_table' in
+                            connection.introspection.table_names())
+            # Running it again on the next deploy is harmless
+            management.call_command('create_cache_table')
+
+    def test_create_cache_table_ignores_other_caches(self):
+        management.call_command('create_cache_table')
+        self.assertFalse('test_cache_table' in
+                         connection.introspection.table_names())
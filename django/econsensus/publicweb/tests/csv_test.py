@@ -4,11 +4,25 @@ Tests for the csv export functionality
 TODO: Check that when you add or update a decision it is reflected in the output.		      
 """
 
+import shutil
+import tempfile
+from datetime import timedelta
+
 from open_consent_test_case import EconsensusFixtureTestCase
 from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.core import management
 from django.core.urlresolvers import reverse
+from django.test.utils import override_settings
+from django.utils import simplejson as json
+from django.utils import timezone
 
 from organizations.models import Organization
+from actionitems.models import ActionItem
+
+from publicweb.export import queryset_iterator, export_rows, \
+    remove_superseded_exports
+from publicweb.models import Decision, Feedback, ExportJob
 
 class CsvTest(EconsensusFixtureTestCase):
     fixtures = ['organizations.json', 'users.json']
@@ -44,4 +58,156 @@ class CsvTest(EconsensusFixtureTestCase):
         response = self.client.get(path)
         self.assertEquals(response.status_code, 403)
 
+    def test_export_csv_contains_decisions_and_feedback(self):
+        decision = Decision.objects.create(description='Exported decision',
+                                           organization=self.test_user_org)
+        Feedback.objects.create(description='Exported feedback',
+                                decision=decision)
+        self.login(self.test_user)
+        path = reverse('publicweb_export_csv', args=(self.test_user_org.slug,))
+        response = self.client.get(path)
+        lines = response.content.splitlines()
+        self.assertTrue(lines[0].startswith('Issue.id,'))
+        self.assertTrue(lines[1].startswith('%d,' % decision.id))
+        self.assertTrue('Exported feedback' in lines[2])
+
+    def test_queryset_iterator_returns_all_rows_in_chunks(self):
+        decisions = [Decision.objects.create(description='Decision %d' % i,
+                                             organization=self.test_user_org)
+                     for i in range(5)]
+        queryset = Decision.objects.filter(organization=self.test_user_org)
+        self.assertEquals([decision.id for decision in decisions],
+            [decision.id for decision in queryset_iterator(queryset, 2)])
+
+    def test_export_query_count_does_not_grow_with_rows(self):
+        for i in range(3):
+            decision = Decision.objects.create(description='Decision %d' % i,
+                                               organization=self.test_user_org)
+            for j in range(2):
+                Feedback.objects.create(description='Feedback %d' % j,
+                                        decision=decision,
+                                        author=self.test_user)
+        ContentType.objects.get_for_model(Feedback)
+        # decisions, feedback, comments and action items
+        with self.assertNumQueries(4):
+            rows = list(export_rows(self.test_user_org))
+        self.assertEquals(len(rows), 1 + 3 + 6)
+
+    def test_export_since_only_contains_changes(self):
+        old_decision = Decision.objects.create(description='Old decision',
+                                               organization=self.test_user_org)
+        Decision.objects.filter(id=old_decision.id).update(
+            last_modified=timezone.now() - timedelta(days=2))
+        new_decision = Decision.objects.create(description='New decision',
+                                               organization=self.test_user_org)
+        since = timezone.now() - timedelta(days=1)
+        self.login(self.test_user)
+        path = reverse('publicweb_export_csv', args=(self.test_user_org.slug,))
+        response = self.client.get(path, {'since': since.isoformat()})
+        lines = response.content.splitlines()
+        self.assertEquals(len(lines), 2)
+        self.assertTrue(lines[1].startswith('%d,' % new_decision.id))
+
+    def test_export_since_contains_decisions_of_deleted_actionitems(self):
+        decision = Decision.objects.create(description='Old decision',
+                                           organization=self.test_user_org)
+        actionitem = ActionItem.objects.create(origin=decision)
+        Decision.objects.filter(id=decision.id).update(
+            last_modified=timezone.now() - timedelta(days=2))
+        actionitem.delete()
+        since = timezone.now() - timedelta(days=1)
+        self.login(self.test_user)
+        path = reverse('publicweb_export_csv', args=(self.test_user_org.slug,))
+        response = self.client.get(path, {'since': since.isoformat()})
+        lines = response.content.splitlines()
+        self.assertEquals(len(lines), 2)
+        self.assertTrue(lines[1].startswith('%d,' % decision.id))
+
+    def test_export_ndjson_has_one_object_per_line(self):
+        decision = Decision.objects.create(description='Exported decision',
+                                           organization=self.test_user_org)
+        feedback = Feedback.objects.create(description='Exported feedback',
+                                           decision=decision)
+        self.login(self.test_user)
+        path = reverse('publicweb_export_csv', args=(self.test_user_org.slug,))
+        response = self.client.get(path, {'format': 'ndjson'})
+        self.assertEquals(response['Content-Type'], 'application/x-ndjson')
+        objects = [json.loads(line) for line in response.content.splitlines()]
+        self.assertEquals(['decision', 'feedback'],
+                          [obj['type'] for obj in objects])
+        self.assertEquals(decision.id, objects[0]['id'])
+        self.assertEquals(feedback.id, objects[1]['id'])
+        self.assertEquals(decision.id, objects[1]['decision_id'])
+
+    def test_export_since_rejects_invalid_date(self):
+        self.login(self.test_user)
+        path = reverse('publicweb_export_csv', args=(self.test_user_org.slug,))
+        response = self.client.get(path, {'since': 'yesterday'})
+        self.assertEquals(response.status_code, 400)
+
+
+class CsvJobTest(EconsensusFixtureTestCase):
+    fixtures = ['organizations.json', 'users.json']
+
+    def setUp(self):
+        self.export_root = tempfile.mkdtemp()
+        self.test_user = User.objects.get(username="betty")
+        self.test_user_org = self.test_user.organization_set.all()[0]
+        self.login(self.test_user)
+        self.path = reverse('publicweb_export_csv_job',
+                            args=(self.test_user_org.slug,))
+
+    def tearDown(self):
+        shutil.rmtree(self.export_root)
+
+    def test_export_job_is_served_once_generated(self):
+        with override_settings(EXPORT_ROOT=self.export_root):
+            Decision.objects.create(description='Exported decision',
+                                    organization=self.test_user_org)
+            response = self.client.get(self.path)
+            self.assertEquals(response.status_code, 202)
+            job = ExportJob.objects.get(organization=self.test_user_org)
+            self.assertEquals(job.status, ExportJob.PENDING_STATUS)
+
+            management.call_command('process_export_jobs')
+
+            response = self.client.get(self.path)
+            self.assertEquals(response.status_code, 200)
+            self.assertEquals(response['Content-Type'], 'text/csv')
+            self.assertTrue(response.content.startswith('Issue.id,'))
+            self.assertTrue('Exported decision' in response.content)
+            self.assertEquals(ExportJob.objects.count(), 1)
+
+    def test_changed_data_needs_new_export(self):
+        with override_settings(EXPORT_ROOT=self.export_root):
+            self.client.get(self.path)
+            management.call_command('process_export_jobs')
+            Decision.objects.create(description='New decision',
+                                    organization=self.test_user_org)
+            response = self.client.get(self.path)
+            self.assertEquals(response.status_code, 202)
+
+    def test_abandoned_export_job_is_run_again(self):
+        with override_settings(EXPORT_ROOT=self.export_root):
+            self.client.get(self.path)
+            job = ExportJob.objects.get(organization=self.test_user_org)
+            self.assertTrue(job.claim())
+            ExportJob.objects.filter(id=job.id).update(
+                claimed_at=timezone.now() - timedelta(days=1))
+            management.call_command('process_export_jobs')
+            job = ExportJob.objects.get(id=job.id)
+            self.assertEquals(job.status, ExportJob.DONE_STATUS)
+
+    def test_superseded_export_is_kept_for_a_grace_period(self):
+        with override_settings(EXPORT_ROOT=self.export_root):
+            self.client.get(self.path)
+            management.call_command('process_export_jobs')
+            Decision.objects.create(description='New decision',
+                                    organization=self.test_user_org)
+            self.client.get(self.path)
+            management.call_command('process_export_jobs')
+            self.assertEquals(ExportJob.objects.count(), 2)
 
+            with override_settings(EXPORT_GRACE_PERIOD=0):
+                remove_superseded_exports(self.test_user_org)
+            self.assertEquals(ExportJob.objects.count(), 1)
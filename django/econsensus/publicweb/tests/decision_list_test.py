@@ -1,9 +1,16 @@
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.cache import cache
 from django.core.urlresolvers import reverse
+from django.test.client import RequestFactory
+from django.test.utils import override_settings
 
 from random import randint, choice
 from string import ascii_letters, digits
 from datetime import date
 
+from notification import models as notification
+from signals.management import DECISION_CHANGE
+
 from decision_test_case import DecisionTestCase
 from publicweb.models import Decision, Feedback
 from publicweb.views import DecisionList
@@ -145,6 +152,110 @@ class DecisionListTest(DecisionTestCase):
         response = self.client.get(reverse('publicweb_item_list', args=[self.bettysorg.slug, 'proposal']))
         self.assertContains(response, "Last Modified")
 
+    def test_feedback_counts_are_listed_for_all_sorts(self):
+        decision = self.create_and_return_decision()
+        for i in range(2):
+            self.create_and_return_feedback(decision=decision)
+        for sort_query in ['-id', 'excerpt', 'feedback', '-deadline']:
+            response = self.client.get(reverse('publicweb_item_list',
+                args=[self.bettysorg.slug, 'proposal']), {'sort': sort_query})
+            object_list = response.context['object_list']
+            self.assertEquals(2, object_list[0].feedback_count,
+                'Wrong feedback count for sort=' + sort_query)
+
+    def test_watched_decisions_are_found_for_the_page(self):
+        watched = self.create_and_return_decision()
+        self.create_and_return_decision()
+        notification.ObservedItem.objects.filter(user=self.user).delete()
+        notification.observe(watched, self.user, DECISION_CHANGE)
+        response = self.client.get(reverse('publicweb_item_list',
+            args=[self.bettysorg.slug, 'proposal']))
+        self.assertEquals(set([watched.id]), response.context['watched_ids'])
+        html = fromstring(response.content)
+        checked = CSSSelector('table.summary-list input[checked]')(html)
+        self.assertEquals(1, len(checked))
+
+    def test_list_rows_are_cached_until_decision_changes(self):
+        cache.clear()
+        decision = self.create_and_return_decision(description='Cached excerpt')
+        path = reverse('publicweb_item_list', args=[self.bettysorg.slug, 'proposal'])
+        self.assertContains(self.client.get(path), 'Cached excerpt')
+        # Not a change the row's cache key sees
+        Decision.objects.filter(id=decision.id).update(excerpt='Sneaky excerpt')
+        self.assertContains(self.client.get(path), 'Cached excerpt')
+        decision = Decision.objects.get(id=decision.id)
+        decision.description = 'Changed excerpt'
+        decision.save()
+        self.assertContains(self.client.get(path), 'Changed excerpt')
+
+    def test_unchanged_list_is_not_modified(self):
+        decision = self.create_and_return_decision()
+        path = reverse('publicweb_item_list', args=[self.bettysorg.slug, 'proposal'])
+        # The first request stores the page size in the session
+        self.client.get(path)
+        etag = self.client.get(path)['ETag']
+        response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEquals(304, response.status_code)
+        # Watching changes the page but not the decisions
+        notification.ObservedItem.objects.filter(user=self.user).delete()
+        response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEquals(200, response.status_code)
+        etag = response['ETag']
+        # A decision in another status changes the counts in the nav
+        self.create_and_return_decision(status=Decision.ARCHIVED_STATUS)
+        response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEquals(200, response.status_code)
+        self.assertContains(response, decision.excerpt)
+
+    def test_order_null_last_can_be_sliced_across_nulls(self):
+        no_deadline = self.create_and_return_decision(deadline=None)
+        later = self.create_and_return_decision(deadline=date(2030, 1, 2))
+        sooner = self.create_and_return_decision(deadline=date(2030, 1, 1))
+        decisions = Decision.objects.order_null_last('deadline',
+            organization=self.bettysorg, status=Decision.PROPOSAL_STATUS)
+        self.assertEquals(3, decisions.count())
+        self.assertEquals([sooner, later, no_deadline], list(decisions))
+        self.assertEquals([later, no_deadline], decisions[1:3])
+        decisions = Decision.objects.order_null_last('-deadline',
+            organization=self.bettysorg, status=Decision.PROPOSAL_STATUS)
+        self.assertEquals([later, sooner, no_deadline], decisions[0:10])
+
+    def test_order_null_last_can_be_used_like_a_queryset(self):
+        no_deadline = self.create_and_return_decision(deadline=None)
+        later = self.create_and_return_decision(deadline=date(2030, 1, 2))
+        sooner = self.create_and_return_decision(deadline=date(2030, 1, 1))
+        decisions = Decision.objects.order_null_last('deadline',
+            organization=self.bettysorg, status=Decision.PROPOSAL_STATUS)
+        self.assertEquals([later, no_deadline],
+                          list(decisions.exclude(id=sooner.id).only('id')))
+        self.assertTrue(decisions.filter(id=no_deadline.id).exists())
+        self.assertFalse(decisions.filter(id=-1))
+        self.assertEquals(3, len(decisions))
+        self.assertEquals([later, no_deadline], decisions[1:])
+
+    @override_settings(CASE_INSENSITIVE_COLLATION=False)
+    def test_case_insensitive_sort_can_be_forced_to_use_lower(self):
+        lower = self.create_and_return_decision(description='apple')
+        upper = self.create_and_return_decision(description='Banana')
+        decisions = Decision.objects.order_by_case_insensitive('description',
+            '', organization=self.bettysorg, status=Decision.PROPOSAL_STATUS)
+        self.assertTrue('lower' in decisions.query.extra_select)
+        self.assertEquals([lower, upper], list(decisions))
+
+    def test_list_does_not_load_descriptions(self):
+        decision_list = DecisionList()
+        decision_list.sort_field = 'id'
+        for tab in decision_list.sort_table_headers:
+            decision_list.status = tab
+            columns = decision_list.get_list_columns()
+            self.assertFalse('description' in columns)
+            self.assertTrue('excerpt' in columns)
+        self.create_and_return_decision()
+        response = self.client.get(reverse('publicweb_item_list',
+            args=[self.bettysorg.slug, 'proposal']))
+        decision = response.context['object_list'][0]
+        self.assertFalse('description' in decision.__dict__)
+
     def test_pagination_set_paginate_by(self):
         # Test the following cases confirming both self.paginate_by and session['num'] is set
         # happy path:
@@ -178,6 +289,42 @@ class DecisionListTest(DecisionTestCase):
                 self.assertEquals(curr_session_num, test_case['expectednum'], "We did not get the expected session value for " + test_case['name'])
                 self.assertEquals(paginator_num, test_case['expectednum'], "We did not get the expected paginator value for " + test_case['name'])
 
+    def test_unchanged_page_size_is_not_written_to_session(self):
+        request = RequestFactory().get('/', {'num': '25'})
+        request.session = SessionStore()
+        request.session['num'] = '25'
+        request.session.modified = False
+        view = DecisionList()
+        view.set_paginate_by(request)
+        self.assertEquals('25', view.paginate_by)
+        self.assertFalse(request.session.modified)
+        request = RequestFactory().get('/', {'num': '50'})
+        request.session = SessionStore()
+        view.set_paginate_by(request)
+        self.assertTrue(request.session.modified)
+
+    @override_settings(CURSOR_PAGINATION=True)
+    def test_cursor_pagination_pages_through_all_items(self):
+        self.create_and_return_decision(deadline=None)
+        for i in range(4):
+            self.create_and_return_decision(description='Decision %d' % i)
+        path = reverse('publicweb_item_list', args=[self.bettysorg.slug, 'proposal'])
+        for sort_query in ['-id', 'deadline', '-deadline', 'excerpt']:
+            expected = list(self.client.get(path, {'sort': sort_query, 'num': 100})
+                            .context['object_list'])
+            pages = []
+            response = self.client.get(path, {'sort': sort_query, 'num': 2})
+            while True:
+                pages.append(list(response.context['object_list']))
+                if not response.context['page_obj'].has_next():
+                    break
+                response = self.client.get(path + response.context['nextstring'])
+            self.assertEquals(expected, sum(pages, []),
+                'Cursor pages out of order for sort=' + sort_query)
+            self.assertEquals([2, 2, 1], [len(page) for page in pages])
+            response = self.client.get(path + response.context['prevstring'])
+            self.assertEquals(pages[-2], list(response.context['object_list']))
+
     def test_pagination_build_query_string(self):
         # Test the following cases confirm expected string is returned
         # A) all defaults - expect next and prev page numbers only
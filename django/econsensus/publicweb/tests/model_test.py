@@ -1,4 +1,5 @@
 from django.core.exceptions import ValidationError
+from django.db import models
 from django.utils import timezone
 from django.test import TestCase
 
@@ -72,6 +73,24 @@ class DecisionLastModifiedTest(EconsensusFixtureTestCase):
         self.assertTrue(orig_last_modified == self.last_modified())
 
 
+    def test_edit_is_found_without_fetching_previous_values(self):
+        decision = Decision.objects.get(id=self.decision.id)
+        orig_last_modified = decision.last_modified
+        decision.description += "x"
+        # The values to compare with were kept when it was loaded
+        with patch.object(Decision.objects, 'get',
+                          side_effect=AssertionError("Decision fetched")):
+            decision.save()
+        self.assertTrue(orig_last_modified < self.last_modified())
+
+    def test_edit_of_deferred_decision_is_found(self):
+        decision = Decision.objects.only('id', 'status').get(id=self.decision.id)
+        orig_last_modified = self.last_modified()
+        decision.description += "x"
+        decision.save()
+        self.assertTrue(orig_last_modified < self.last_modified())
+
+
 class ModelTest(TestCase):
     def test_get_author_name(self):
         feedback = Feedback(author=None)
@@ -167,3 +186,56 @@ class ModelTestSlow(DecisionTestCase):
         self.assertTrue("comment" in statistics)
 
 
+
+    def test_feedback_counters_follow_saves_and_deletes(self):
+        decision = self.make_decision()
+        feedback = Feedback(description="Feedback test data", decision=decision,
+                            rating=Feedback.DANGER_STATUS, author=self.user)
+        feedback.save()
+        Feedback(description="Feedback test data", decision=decision,
+                 rating=Feedback.CONSENT_STATUS, resolved=True,
+                 author=self.user).save()
+        decision = Decision.objects.get(id=decision.id)
+        self.assertEqual(2, decision.feedback_count)
+        self.assertEqual(1, decision.unresolved_feedback_count)
+        self.assertEqual(1, decision.get_feedback_statistics()['danger'])
+        self.assertEqual(1, decision.get_feedback_statistics()['consent'])
+
+        feedback.delete()
+        decision = Decision.objects.get(id=decision.id)
+        self.assertEqual(1, decision.feedback_count)
+        self.assertEqual(0, decision.unresolved_feedback_count)
+        self.assertEqual(0, decision.get_feedback_statistics()['danger'])
+
+    def test_saving_a_stale_decision_keeps_feedback_counters(self):
+        decision = self.make_decision()
+        stale = Decision.objects.get(id=decision.id)
+        Feedback(description="Feedback test data", decision=decision,
+                 rating=Feedback.COMMENT_STATUS, author=self.user).save()
+        stale.note_external_modification()
+        stale.description = "Changed"
+        stale.save()
+        decision = Decision.objects.get(id=decision.id)
+        self.assertEqual(1, decision.feedback_count)
+        self.assertEqual(1, decision.comment_feedback_count)
+        self.assertEqual(1, decision.get_feedback_statistics()['comment'])
+
+    def test_saving_a_decision_sends_pre_and_post_save(self):
+        decision = self.make_decision()
+        sent = []
+
+        def handler(signal, instance, **kwargs):
+            sent.append((signal, instance, kwargs.get('created')))
+
+        models.signals.pre_save.connect(handler, sender=Decision)
+        models.signals.post_save.connect(handler, sender=Decision)
+        try:
+            decision.description = "Changed"
+            decision.save()
+        finally:
+            models.signals.pre_save.disconnect(handler, sender=Decision)
+            models.signals.post_save.disconnect(handler, sender=Decision)
+        self.assertEqual([(models.signals.pre_save, decision, None),
+                          (models.signals.post_save, decision, False)], sent)
+        self.assertEqual("Changed",
+                         Decision.objects.get(id=decision.id).description)
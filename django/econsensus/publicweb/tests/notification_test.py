@@ -1,3 +1,5 @@
+from mock import patch
+
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.test import TestCase
@@ -5,6 +7,7 @@ from django.core import mail
 from django.core.mail import EmailMessage
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.sites.models import Site
+from django.db import connection
 
 from notification import models as notification
 from guardian.shortcuts import assign_perm
@@ -16,9 +19,14 @@ from django.utils import timezone
 
 from publicweb.tests.factories import DecisionFactory, UserFactory, \
         FeedbackFactory, NotificationSettingsFactory, OrganizationUserFactory
-from publicweb.extra_models import NotificationSettings, NO_NOTIFICATIONS, \
+from publicweb.observation_manager import (ObservationManager,
+    NOTIFICATION_THRESHOLDS)
+from custom_notification import utils as notification_utils
+from signals.management import DECISION_NEW, FEEDBACK_NEW
+from publicweb.extra_models import NotificationSettings, OrganizationSettings, \
+    NO_NOTIFICATIONS, \
     MAIN_ITEMS_NOTIFICATIONS_ONLY, FEEDBACK_ADDED_NOTIFICATIONS, \
-    FEEDBACK_MAJOR_CHANGES
+    FEEDBACK_MAJOR_CHANGES, NOTIFICATION_LEVELS
 
 
 class NotificationTest(DecisionTestCase):
@@ -36,6 +44,72 @@ class NotificationTest(DecisionTestCase):
             notification_level=notification_level
         )
 
+    def test_recipients_are_selected_by_level_in_the_database(self):
+        org = self.bettysorg
+        users = list(org.users.all())
+        NotificationSettings.objects.filter(organization=org).delete()
+        self.create_settings(users[0], NO_NOTIFICATIONS, org)
+        OrganizationSettings.objects.filter(organization=org).delete()
+        OrganizationSettings.objects.create(organization=org,
+            default_notification_level=MAIN_ITEMS_NOTIFICATIONS_ONLY)
+
+        manager = ObservationManager()
+        notified = manager.get_notified_users(users, org, DECISION_NEW)
+        self.assertEqual(set(users[1:]), set(notified))
+        self.assertEqual(len(users),
+            NotificationSettings.objects.filter(organization=org).count())
+        self.assertEqual([], manager.get_notified_users(users, org,
+                                                        FEEDBACK_NEW))
+
+        with self.assertNumQueries(2):
+            notified = manager.get_notified_users(users, org, DECISION_NEW)
+        self.assertEqual(set(users[1:]), set(notified))
+
+    def test_settings_are_found_and_created_in_bulk(self):
+        org = self.bettysorg
+        users = list(org.users.all())
+        self.assertGreater(len(users), 2)
+        NotificationSettings.objects.filter(organization=org).delete()
+        self.create_settings(users[0], NO_NOTIFICATIONS, org)
+        OrganizationSettings.objects.filter(organization=org).delete()
+        OrganizationSettings.objects.create(organization=org,
+            default_notification_level=FEEDBACK_MAJOR_CHANGES)
+
+        # The existing settings, the organization's default level and one
+        # insert, inside a savepoint where the database has them
+        queries = 3
+        if connection.features.uses_savepoints:
+            queries += 2
+        with self.assertNumQueries(queries):
+            ObservationManager().create_missing_settings(users, org)
+        levels = dict(NotificationSettings.objects.filter(organization=org)
+                      .values_list('user', 'notification_level'))
+        self.assertEqual(NO_NOTIFICATIONS, levels.pop(users[0].pk))
+        self.assertEqual(set(user.pk for user in users[1:]), set(levels))
+        self.assertEqual(set([FEEDBACK_MAJOR_CHANGES]), set(levels.values()))
+
+        with self.assertNumQueries(1):
+            ObservationManager().create_missing_settings(users, org)
+
+    def test_each_notification_type_has_its_level_threshold(self):
+        org = self.bettysorg
+        manager = ObservationManager()
+        NotificationSettings.objects.filter(user=self.user,
+                                            organization=org).delete()
+        self.create_settings(self.user, NO_NOTIFICATIONS, org)
+        levels = [level for level, name in NOTIFICATION_LEVELS]
+        for notification_type, threshold in NOTIFICATION_THRESHOLDS.items():
+            # At the threshold, one level below it and one above it
+            for level in (threshold - 1, threshold, threshold + 1):
+                if level not in levels:
+                    continue
+                NotificationSettings.objects.filter(user=self.user,
+                    organization=org).update(notification_level=level)
+                notified = manager.get_notified_users([self.user], org,
+                                                      notification_type)
+                self.assertEqual(level >= threshold, self.user in notified,
+                    "%s at level %s" % (notification_type, level))
+
     def get_addresses_from_outbox(self, outbox):
         return_list = list()
         for thismail in outbox:
@@ -123,6 +197,22 @@ class NotificationTest(DecisionTestCase):
         self.assertNotIn('&amp', outbox[0].subject)
         self.assertNotIn('&amp', outbox[0].body)
 
+    def test_notices_are_rendered_once_for_all_recipients(self):
+        with patch('custom_notification.utils.get_formatted_messages',
+                   wraps=notification_utils.get_formatted_messages) as render:
+            decision = self.make_decision()
+        recipients = decision.organization.users.count()
+        self.assertGreater(recipients, 1)
+        self.assertEqual(recipients, len(mail.outbox))
+        self.assertEqual(1, render.call_count)
+
+    def test_notices_are_left_to_the_library_to_queue(self):
+        with self.settings(NOTIFICATION_QUEUE_ALL=True):
+            with patch('custom_notification.utils.send') as send:
+                self.make_decision()
+        self.assertTrue(send.called)
+        self.assertEqual([], mail.outbox)
+
     def test_notifications_sent_to_author(self):
         self.create_decision_through_browser()
 
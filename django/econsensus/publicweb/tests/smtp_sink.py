@@ -0,0 +1,43 @@
+#A local SMTP server which keeps the emails it is sent, to allow testing of
+#sending emails over SMTP without using a full email server
+import asyncore
+import smtpd
+import threading
+
+
+class SMTPSink(smtpd.SMTPServer):
+    """
+    Listens on a free port of localhost (see self.port) once started, in a
+    thread of its own. Each email received is kept in self.messages as a
+    (from address, recipients, data) tuple, and each connection made is
+    counted in self.connections.
+    """
+    def __init__(self, host='127.0.0.1', port=0):
+        smtpd.SMTPServer.__init__(self, (host, port), None)
+        self.host, self.port = self.socket.getsockname()
+        self.messages = []
+        self.connections = 0
+        self._stopped = False
+        self._thread = None
+
+    def handle_accept(self):
+        self.connections += 1
+        smtpd.SMTPServer.handle_accept(self)
+
+    def process_message(self, peer, mailfrom, rcpttos, data):
+        self.messages.append((mailfrom, rcpttos, data))
+
+    def _serve(self):
+        while not self._stopped:
+            asyncore.loop(timeout=0.05, count=1)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._serve)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped = True
+        self._thread.join()
+        self.close()
@@ -0,0 +1,78 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
+from django.utils import simplejson as json
+
+from organizations.models import Organization
+
+from publicweb.models import Decision
+from publicweb.summary import get_organization_summary
+from publicweb.templatetags.publicweb_filters import organization_summary
+from publicweb.tests.decision_test_case import DecisionTestCase
+
+
+class OrganizationSummaryTest(DecisionTestCase):
+
+    def setUp(self):
+        super(OrganizationSummaryTest, self).setUp()
+        cache.clear()
+
+    def test_summary_counts_items_by_status(self):
+        decision = self.create_and_return_decision()
+        self.create_and_return_decision(status=Decision.ARCHIVED_STATUS)
+        self.create_and_return_feedback(decision=decision)
+        summary = get_organization_summary(self.bettysorg)
+        self.assertEquals(1, summary['proposal'])
+        self.assertEquals(1, summary['archived'])
+        self.assertEquals(0, summary['decision'])
+        self.assertEquals(1, summary['unresolved_feedback'])
+        self.assertEquals(0, summary['actionitems'])
+
+    def test_summary_is_cached_until_items_change(self):
+        get_organization_summary(self.bettysorg)
+        with self.assertNumQueries(0):
+            summary = get_organization_summary(self.bettysorg)
+        self.assertEquals(0, summary['proposal'])
+        decision = self.create_and_return_decision()
+        self.assertEquals(1, get_organization_summary(self.bettysorg)['proposal'])
+        feedback = self.create_and_return_feedback(decision=decision)
+        self.assertEquals(1,
+            get_organization_summary(self.bettysorg)['unresolved_feedback'])
+        feedback.delete()
+        self.assertEquals(0,
+            get_organization_summary(self.bettysorg)['unresolved_feedback'])
+
+    def test_summary_endpoint_returns_json(self):
+        self.create_and_return_decision()
+        response = self.client.get(reverse('publicweb_organization_summary',
+                                           args=[self.bettysorg.slug]))
+        self.assertEquals('application/json', response['Content-Type'])
+        self.assertEquals(1, json.loads(response.content)['proposal'])
+
+    def test_summary_endpoint_is_only_for_members(self):
+        other_org = Organization.objects.exclude(
+            id__in=self.user.organization_set.values_list('id', flat=True))[0]
+        response = self.client.get(reverse('publicweb_organization_summary',
+                                           args=[other_org.slug]))
+        self.assertEquals(403, response.status_code)
+
+    def test_moving_a_decision_updates_both_summaries(self):
+        other_org = Organization.objects.exclude(id=self.bettysorg.id)[0]
+        decision = self.create_and_return_decision()
+        self.assertEquals(1, get_organization_summary(self.bettysorg)['proposal'])
+        other_count = get_organization_summary(other_org)['proposal']
+        decision.organization = other_org
+        decision.save()
+        self.assertEquals(0, get_organization_summary(self.bettysorg)['proposal'])
+        self.assertEquals(other_count + 1,
+                          get_organization_summary(other_org)['proposal'])
+
+    def test_nav_only_shows_counts_to_members(self):
+        self.create_and_return_decision()
+        response = self.client.get(reverse('publicweb_item_list',
+            args=[self.bettysorg.slug, 'proposal']))
+        self.assertContains(response, '<span class="count">(1)</span>')
+        non_member = User.objects.exclude(
+            id__in=self.bettysorg.users.values_list('id', flat=True))[0]
+        self.assertEquals(None,
+            organization_summary(self.bettysorg, non_member))
@@ -1,4 +1,12 @@
+from django.conf import settings
+from django.contrib import messages
+from django.contrib.comments.models import Comment
+from django.contrib.messages.storage.cookie import CookieStorage
 from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test.client import RequestFactory
+from django.utils import simplejson as json
+from publicweb.conditional import decision_etag
 from publicweb.tests.decision_test_case import DecisionTestCase
 from publicweb.models import Feedback, Decision
 
@@ -46,3 +54,129 @@ class ViewDecisionTest(DecisionTestCase):
 
         form_data = self.get_form_values_from_response(response, 1)
         self.assertTrue(form_fields.issubset(set(form_data.keys())))
+
+    def test_unchanged_decision_snippet_is_not_modified(self):
+        decision = self.create_and_return_decision()
+        path = reverse('publicweb_decision_snippet_detail', args=[decision.id])
+        response = self.client.get(path)
+        self.assertEquals(200, response.status_code)
+        self.assertIn('must-revalidate', response['Cache-Control'])
+        etag = response['ETag']
+        response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEquals(304, response.status_code)
+        self.create_and_return_feedback(decision=decision)
+        response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEquals(200, response.status_code)
+        self.assertNotEquals(etag, response['ETag'])
+
+    def test_unchanged_feedback_snippet_is_not_modified(self):
+        feedback = self.create_and_return_feedback()
+        path = reverse('publicweb_feedback_snippet_detail', args=[feedback.id])
+        etag = self.client.get(path)['ETag']
+        response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEquals(304, response.status_code)
+        feedback.description = 'Changed feedback'
+        feedback.save()
+        response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'Changed feedback')
+
+    def test_decision_page_is_modified_by_new_comments(self):
+        feedback = self.create_and_return_feedback()
+        path = reverse('publicweb_item_detail', args=[feedback.decision.id])
+        etag = self.client.get(path)['ETag']
+        # Doesn't touch the decision, unlike posting through the site
+        Comment.objects.create(content_object=feedback,
+            site_id=settings.SITE_ID, user=self.user, comment='New comment')
+        response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'New comment')
+
+    def test_pages_with_messages_are_not_revalidated(self):
+        decision = self.create_and_return_decision()
+        request = RequestFactory().get('/')
+        request.user = self.user
+        request._messages = CookieStorage(request)
+        self.assertTrue(decision_etag(request, decision.id))
+        messages.info(request, 'Saved')
+        self.assertEquals(None, decision_etag(request, decision.id))
+
+    def count_queries(self, path):
+        connection.use_debug_cursor = True
+        start = len(connection.queries)
+        try:
+            response = self.client.get(path)
+        finally:
+            connection.use_debug_cursor = False
+        self.assertEquals(200, response.status_code)
+        return len(connection.queries) - start
+
+    def test_decision_page_queries_do_not_grow_with_feedback(self):
+        paths = []
+        for feedback_count in (2, 20):
+            decision = self.create_and_return_decision()
+            for i in range(feedback_count):
+                feedback = self.create_and_return_feedback(decision=decision,
+                    description='Feedback %d' % i)
+                Comment.objects.create(content_object=feedback,
+                    site_id=settings.SITE_ID, user=self.user,
+                    comment='Comment on %d' % i)
+            paths.append(reverse('publicweb_item_detail', args=[decision.id]))
+        # Fill the caches shared by the pages
+        for path in paths:
+            self.client.get(path)
+        response = self.client.get(paths[1])
+        self.assertContains(response, 'Comment on 19')
+        self.assertEquals(self.count_queries(paths[0]),
+                          self.count_queries(paths[1]))
+
+    def test_feedback_statistics_follow_counts(self):
+        decision = self.create_and_return_decision()
+        self.create_and_return_feedback(decision=decision)
+        path = reverse('publicweb_decision_snippet_detail', args=[decision.id])
+        self.assertContains(self.client.get(path), '<dd>1</dd>')
+        self.assertContains(self.client.get(path), '<dd>1</dd>')
+        self.create_and_return_feedback(decision=decision)
+        self.assertContains(self.client.get(path), '<dd>2</dd>')
+
+    def test_feedback_json_update_returns_changes_and_counters(self):
+        feedback = self.create_and_return_feedback(description='Old feedback')
+        response = self.client.post(
+            reverse('publicweb_feedback_json_update', args=[feedback.id]),
+            {'rating': Feedback.DANGER_STATUS,
+             'description': 'New feedback\nsee http://example.com'})
+        self.assertEquals('application/json', response['Content-Type'])
+        data = json.loads(response.content)
+        self.assertEquals(feedback.id, data['id'])
+        self.assertEquals('danger', data['rating'])
+        self.assertIn('<br />', data['description'])
+        self.assertIn('<a href="http://example.com"', data['description'])
+        self.assertEquals(1, data['counters']['danger'])
+        self.assertEquals(0, data['counters']['comment'])
+
+    def test_feedback_json_create_returns_snippet_and_counters(self):
+        decision = self.create_and_return_decision()
+        response = self.client.post(
+            reverse('publicweb_feedback_json_create', args=[decision.id]),
+            {'rating': Feedback.CONSENT_STATUS, 'description': 'Agreed'})
+        data = json.loads(response.content)
+        self.assertTrue(data['html'].strip().startswith('<li id="id%d"' % data['id']))
+        self.assertEquals(1, data['counters']['consent'])
+
+    def test_decision_json_update_returns_snippet_and_counters(self):
+        decision = self.create_and_return_decision()
+        self.create_and_return_feedback(decision=decision)
+        response = self.client.post(
+            reverse('publicweb_decision_json_update', args=[decision.id]),
+            {'description': 'Feed the cat', 'status': decision.status})
+        data = json.loads(response.content)
+        self.assertTrue(data['html'].strip().startswith(
+            '<div id="decision_snippet_envelope">'))
+        self.assertIn('Feed the cat', data['html'])
+        self.assertEquals(1, data['counters']['comment'])
+
+    def test_invalid_json_update_returns_errors(self):
+        feedback = self.create_and_return_feedback()
+        response = self.client.post(
+            reverse('publicweb_feedback_json_update', args=[feedback.id]),
+            {'rating': 99, 'description': 'Unrated'})
+        self.assertEquals(400, response.status_code)
+        self.assertIn('rating', json.loads(response.content)['errors'])
@@ -3,14 +3,18 @@ from django.contrib.auth.decorators import login_required
 from django.views.generic.detail import DetailView
 
 from views import (DecisionCreate, DecisionUpdate, DecisionDetail, DecisionList,
-                    ExportCSV, FeedbackCreate, FeedbackSnippetCreate,
-                    FeedbackUpdate, EconsensusActionitemCreateView,
+                    ExportCSV, ExportCSVJob, FeedbackCreate,
+                    FeedbackSnippetCreate, FeedbackUpdate, EconsensusActionitemCreateView,
                     EconsensusActionitemUpdateView,
                     EconsensusActionitemListView, OrganizationRedirectView,
                     YourDetails, UserNotificationSettings,
-                    EconsensusActionitemDetailView, DecisionSearchView)
+                    EconsensusActionitemDetailView, DecisionSearchView,
+                    OrganizationSummary, FeedbackCreateJSON,
+                    FeedbackUpdateJSON, DecisionUpdateJSON,
+                    EconsensusActionitemUpdateJSON)
 
 from models import Feedback
+from conditional import revalidated, feedback_etag
 from publicweb.views import AddWatcher, RemoveWatcher
 
 
@@ -25,9 +29,16 @@ urlpatterns = patterns('econsensus.publicweb.views',
     url(r'^remove_watcher/(?P<decision_id>\d+)/$', RemoveWatcher.as_view(),
         name="remove_watcher"),
 
+    url(r'^(?P<org_slug>[-\w]+)/summary/$',
+        OrganizationSummary.as_view(),
+        name='publicweb_organization_summary'),
+
     url(r'^(?P<org_slug>[-\w]+)/export_csv/$',
         ExportCSV.as_view(),
         name='publicweb_export_csv'),
+    url(r'^(?P<org_slug>[-\w]+)/export_csv/job/$',
+        ExportCSVJob.as_view(),
+        name='publicweb_export_csv_job'),
 
     # Feedback urls...
     url(r'^feedback/create/(?P<parent_pk>[\d]+)/$',
@@ -37,9 +48,9 @@ urlpatterns = patterns('econsensus.publicweb.views',
         FeedbackUpdate.as_view(template_name='feedback_update_page.html'),
         name='publicweb_feedback_update'),
     url(r'^feedback/detail/(?P<pk>[\d]+)/$',
-        login_required(DetailView.as_view(
+        login_required(revalidated(feedback_etag)(DetailView.as_view(
             model=Feedback,
-            template_name='feedback_detail_page.html')),
+            template_name='feedback_detail_page.html'))),
         name='publicweb_feedback_detail'),
     url(r'^feedback/comment/(?P<pk>[\d]+)/$',
         login_required(DetailView.as_view(
@@ -55,10 +66,17 @@ urlpatterns = patterns('econsensus.publicweb.views',
         FeedbackUpdate.as_view(template_name='feedback_update_snippet.html'),
         name='publicweb_feedback_snippet_update'),
     url(r'^feedback/detail/snippet/(?P<pk>[\d]+)/$',
-        login_required(DetailView.as_view(
+        login_required(revalidated(feedback_etag)(DetailView.as_view(
             model=Feedback,
-            template_name='feedback_detail_snippet.html')),
+            template_name='feedback_detail_snippet.html'))),
         name='publicweb_feedback_snippet_detail'),
+    # json
+    url(r'^feedback/create/json/(?P<parent_pk>[\d]+)/$',
+        FeedbackCreateJSON.as_view(),
+        name='publicweb_feedback_json_create'),
+    url(r'^feedback/update/json/(?P<pk>[\d]+)/$',
+        FeedbackUpdateJSON.as_view(),
+        name='publicweb_feedback_json_update'),
 
     # decision urls...
     url(r'^(?P<org_slug>[-\w]+)/decision/create/(?P<status>[a-z]+)/$',
@@ -80,6 +98,10 @@ urlpatterns = patterns('econsensus.publicweb.views',
     url(r'^decision/detail/snippet/(?P<pk>[\d]+)/$',
         DecisionDetail.as_view(template_name='decision_detail_snippet.html'),
         name='publicweb_decision_snippet_detail'),
+    # json
+    url(r'^decision/update/json/(?P<pk>[\d]+)/$',
+        DecisionUpdateJSON.as_view(),
+        name='publicweb_decision_json_update'),
 
     # item urls
     url(r'^item/detail/(?P<pk>[\d]+)/$',
@@ -102,6 +124,9 @@ urlpatterns = patterns('econsensus.publicweb.views',
     url(r'^item/detail/(?P<decisionpk>[\d]+)/actionitem/(?P<pk>[\d]+)/update/$',
         EconsensusActionitemUpdateView.as_view(),
         name='actionitem_update'),
+    url(r'^item/detail/(?P<decisionpk>[\d]+)/actionitem/(?P<pk>[\d]+)/update/json/$',
+        EconsensusActionitemUpdateJSON.as_view(),
+        name='actionitem_json_update'),
     url(r'^(?P<org_slug>[-\w]+)/actionitem/list/$',
         EconsensusActionitemListView.as_view(),
         name='actionitem_list'),
@@ -1,9 +1,10 @@
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.contrib.comments.models import Comment
 from django.contrib.contenttypes.models import ContentType
 from django.http import (HttpResponse, HttpResponseRedirect,
-    HttpResponseForbidden, Http404)
+    HttpResponseForbidden, HttpResponseBadRequest, Http404)
 from django.utils.decorators import method_decorator
 from django.utils.translation import ugettext_lazy as _
 from django.views.generic.base import View, RedirectView
@@ -13,10 +14,17 @@ from django.views.generic.edit import ProcessFormView, ModelFormMixin
 from django.views.generic.list import ListView
 from django.views.generic.edit import CreateView, UpdateView
 from django.shortcuts import get_object_or_404
-
-import unicodecsv
+from django.core.servers.basehttp import FileWrapper
+from django.template.defaultfilters import linebreaksbr, urlize
+from django.template.loader import render_to_string
+from django.template.response import TemplateResponse
+from django.template import RequestContext
+from django.utils import formats
+from django.utils import simplejson as json
+from django.core.serializers.json import DjangoJSONEncoder
 
 from guardian.decorators import permission_required_or_403
+from guardian.shortcuts import get_perms
 from notification import models as notification
 from organizations.models import Organization
 from haystack.views import SearchView
@@ -25,7 +33,14 @@ from waffle import switch_is_active
 from publicweb.forms import (YourDetailsForm,
         NotificationSettingsForm, EconsensusActionItemCreateForm,
         EconsensusActionItemUpdateForm, DecisionForm, FeedbackForm)
-from publicweb.models import Decision, Feedback, NotificationSettings
+from publicweb.models import (Decision, Feedback, NotificationSettings,
+    ExportJob)
+from publicweb.summary import get_organization_summary
+from publicweb.conditional import (revalidated, decision_etag,
+                                   decision_list_etag)
+from publicweb.pagination import CursorPaginationMixin, CursorPage, SortKey
+from publicweb.export import (EXPORT_FORMATS, get_export_file_name,
+    get_export_storage, request_export_job, parse_since, group_by)
 
 from actionitems.models import ActionItem
 from actionitems.views import (ActionItemCreateView, ActionItemUpdateView,
@@ -33,6 +48,48 @@ from actionitems.views import (ActionItemCreateView, ActionItemUpdateView,
 from django.core.urlresolvers import reverse
 from signals.management import DECISION_CHANGE
 
+def remember_page_size(request, num):
+    """
+    Keeps the number of items per page in the user's session. Assigning to
+    the session makes it save to the database, even if the value is the
+    same, so it is only assigned when the number has changed.
+    """
+    if request.session.get('num') != num:
+        request.session['num'] = num
+
+
+def render_description(description):
+    """
+    Renders a description as the detail snippets do.
+    """
+    return linebreaksbr(urlize(description or '', autoescape=True),
+                        autoescape=True)
+
+
+class JSONFormMixin(object):
+    """
+    For the forms that the item detail page posts in the background: a
+    valid form is saved and answered with JSON describing the changes (see
+    get_json_data()) instead of a redirect to a page the script would
+    throw away, and an invalid one with its errors and status 400.
+    """
+    http_method_names = ['post']
+
+    def form_valid(self, form):
+        super(JSONFormMixin, self).form_valid(form)
+        return self.render_json(self.get_json_data())
+
+    def form_invalid(self, form):
+        errors = dict((field, [unicode(error) for error in field_errors])
+                      for field, field_errors in form.errors.items())
+        return HttpResponseBadRequest(json.dumps({'errors': errors}),
+                                      mimetype='application/json')
+
+    def render_json(self, data):
+        return HttpResponse(json.dumps(data, cls=DjangoJSONEncoder),
+                            mimetype='application/json')
+
+
 class YourDetails(UpdateView):
     template_name = 'your_details.html'
     form_class = YourDetailsForm
@@ -70,115 +127,69 @@ class ExportCSV(View):
         '''
         Create the HttpResponse object with the appropriate CSV header and
         corresponding CSV data from Decision, Feedback and Comment.
-        Expected input: request (not quite sure what this is!)
-        Expected output: http containing MIME info followed by the data itself
-        as CSV.
+        The CSV is generated row by row as the response is sent, so the
+        first bytes go out straight away and memory use doesn't grow with
+        the size of the organization.
+        An optional 'since' date/time parameter limits the export to the
+        changes made since then, and format=ndjson gives newline delimited
+        JSON instead of CSV.
         '''
+        try:
+            since = parse_since(request.GET.get('since'))
+        except ValueError:
+            return HttpResponseBadRequest(
+                unicode(_("Invalid 'since' date/time")))
+        try:
+            export, mimetype, extension = \
+                EXPORT_FORMATS[request.GET.get('format', 'csv')]
+        except KeyError:
+            return HttpResponseBadRequest(unicode(_("Unknown export format")))
+        response = HttpResponse(export(self.organization, since),
+                                mimetype=mimetype)
+        response['Content-Disposition'] = ('attachment; filename=%s' %
+               get_export_file_name(self.organization, extension=extension))
+        return response
 
-        response = HttpResponse(mimetype='text/csv')
-        response['Content-Disposition'] = ('attachment; '
-               'filename=econsensus_decision_data_%s.csv' %
-               unicode(self.organization.slug))
-
-        def field_sorter(s):
-            """
-            Impose an order on certain fields.
-            Fields not specified below will appear in arbitrary order at end of
-            list.
-            """
-            if s == 'id': return '\t 00 %s' % s
-            elif s == 'creation': return '\t 01 %s' % s
-            elif s == 'submit_date': return '\t 02 %s' % s
-            elif s == 'author': return '\t 03 %s' % s
-            elif s == 'user': return '\t 04 %s' % s
-            elif s == 'user_name': return '\t 05 %s' % s
-            elif s == 'user_email': return '\t 06 %s' % s
-            elif s == 'user_url': return '\t 07 %s' % s
-            elif s == 'excerpt': return '\t 08 %s' % s
-            elif s == 'description': return '\t 09 %s' % s
-            elif s == 'budget': return '\t 10 %s' % s
-            elif s == 'people': return '\t 11 %s' % s
-            elif s == 'meeting_people': return '\t 12 %s' % s
-            elif s == 'effective_date': return '\t 13 %s' % s
-            elif s == 'deadline': return '\t 14 %s' % s
-            elif s == 'expiry_date': return '\t 15 %s' % s
-            elif s == 'review_date': return '\t 16 %s' % s
-            elif s == 'tags': return '\t 17 %s' % s
-            elif s == 'status': return '\t 18 %s' % s
-            elif s == 'last_status': return '\t 19 %s' % s
-            elif s == 'last_modified': return '\t 20 %s' % s
-            elif s == 'editor': return '\t 21 %s' % s
-            elif s == 'decided_date': return '\t 22 %s' % s
-            elif s == 'archived_date': return '\t 23 %s' % s
-            else: return s
-
-        def remove_field(l, field_name):
-            if field_name in l:
-                l.remove(field_name)
-
-        def field_value(obj, field_name):
-            if isinstance(obj, Feedback) and field_name == 'rating':
-                value = obj.get_rating_display()
-            else:
-                value = getattr(obj, field_name)
-            return unicode(value).encode("utf-8", "replace")
-
-        decision_field_names = sorted(
-          list(
-            set([field.name for field in Decision._meta.fields])
-          ),
-          key=field_sorter
-        )
-        feedback_field_names = sorted(
-          list(
-            set([field.name for field in Feedback._meta.fields])
-          ),
-          key=field_sorter)
-        comment_field_names = sorted(list(set([field.name for field in Comment._meta.fields])), key=field_sorter)
-        actionitem_field_names = sorted(list(set([field.name for field in ActionItem._meta.fields])), key=field_sorter)
-
-        # Remove fields implied by filename (organization) or csv layout:
-        remove_field(decision_field_names, 'organization')
-        remove_field(feedback_field_names, 'decision')
-        remove_field(comment_field_names, 'content_type')
-        remove_field(comment_field_names, 'object_pk')
-        remove_field(actionitem_field_names, 'origin')
-
-        decision_column_titles = ["Issue.%s" % field_name for field_name in decision_field_names]
-        feedback_column_titles = ["Feedback.%s" % field_name for field_name in feedback_field_names]
-        comment_column_titles = ["Comment.%s" % field_name for field_name in comment_field_names]
-        actionitem_column_titles = ["ActionItem.%s" % field_name for field_name in actionitem_field_names]
-
-        writer = unicodecsv.writer(response)
-        writer.writerow(decision_column_titles + feedback_column_titles +
-                        comment_column_titles + actionitem_column_titles)
-
-        no_decision_data = [u""] * len(decision_field_names)
-        no_feedback_data = [u""] * len(feedback_field_names)
-        no_comment_data = [u""] * len(comment_field_names)
-        no_actionitem_data = [u""] * len(actionitem_field_names)
-
-        for decision in Decision.objects.filter(organization=self.organization).order_by('id'):
-            decision_data = [field_value(decision, field_name) for field_name in decision_field_names]
-            writer.writerow(decision_data + no_feedback_data + no_comment_data + no_actionitem_data)
-
-            for feedback in decision.feedback_set.all().order_by('id'):
-                feedback_data = [field_value(feedback, field_name) for field_name in feedback_field_names]
-                writer.writerow(no_decision_data + feedback_data + no_comment_data + no_actionitem_data)
-
-                comments = Comment.objects.filter(
-                    content_type=ContentType.objects.get_for_model(Feedback),
-                    object_pk=feedback.id
-                ).order_by('id')
-                for comment in comments:
-                    comment_data = [field_value(comment, field_name) for field_name in comment_field_names]
-                    writer.writerow(no_decision_data + no_feedback_data + comment_data + no_actionitem_data)
-
-            for actionitem in ActionItem.objects.filter(origin=decision.id).order_by('id'):
-                actionitem_data = [field_value(actionitem, field_name) for field_name in actionitem_field_names]
-                writer.writerow(no_decision_data + no_feedback_data + no_comment_data + actionitem_data)
 
-        return response
+class OrganizationSummary(View):
+    """
+    Counts of the items in each tab of an organization, and of its
+    unresolved feedback, as JSON.
+    """
+    @method_decorator(login_required)
+    def dispatch(self, request, *args, **kwargs):
+        self.organization = get_object_or_404(Organization,
+                                              slug=kwargs.get('org_slug'))
+        if not self.organization.is_member(request.user):
+            return HttpResponseForbidden(_("Whoops, wrong organization"))
+        return super(OrganizationSummary, self).dispatch(request, *args,
+                                                         **kwargs)
+
+    def get(self, request, *args, **kwargs):
+        return HttpResponse(
+            json.dumps(get_organization_summary(self.organization)),
+            mimetype='application/json')
+
+
+class ExportCSVJob(ExportCSV):
+    """
+    Serves the organization's export from a file generated in the
+    background by the process_export_jobs management command. Until the
+    file for the current state of the organization's data is ready, a page
+    saying so is shown instead.
+    """
+    def get(self, request, *args, **kwargs):
+        job = request_export_job(self.organization)
+        if job.status == ExportJob.DONE_STATUS:
+            export_file = get_export_storage().open(job.file_name)
+            response = HttpResponse(FileWrapper(export_file),
+                                    mimetype='text/csv')
+            response['Content-Disposition'] = ('attachment; filename=%s' %
+                   get_export_file_name(self.organization))
+            return response
+        context = {'organization': self.organization, 'job': job}
+        return TemplateResponse(request, 'export_job.html', context,
+                                status=202)
 
 
 class DecisionDetail(DetailView):
@@ -188,18 +199,64 @@ class DecisionDetail(DetailView):
     def dispatch(self, *args, **kwargs):
         return super(DecisionDetail, self).dispatch(*args, **kwargs)
 
+    @method_decorator(revalidated(decision_etag))
+    def get(self, *args, **kwargs):
+        return super(DecisionDetail, self).get(*args, **kwargs)
+
+    def get_queryset(self):
+        return Decision.objects.select_related('organization', 'author',
+                                               'editor')
+
     def get_context_data(self, *args, **kwargs):
         context = super(DecisionDetail, self).get_context_data(*args, **kwargs)
         context['organization'] = self.object.organization
         context['tab'] = self.object.status
         context['rating_names'] = [unicode(x) for x in Feedback.rating_names]
+        # The permissions and feedback are loaded here, once, when the
+        # template first uses them, rather than by each feedback and action
+        # item snippet.
+        context['preloaded'] = True
+        context['organization_permissions'] = self.get_organization_permissions
+        context['feedback_list'] = self.get_feedback_list
         if switch_is_active('actionitems'):
             context['actionitems'] = ActionItem.objects.filter(origin=self.kwargs['pk'])
         return context
 
-
-class DecisionList(ListView):
+    def get_organization_permissions(self):
+        if not hasattr(self, '_organization_permissions'):
+            self._organization_permissions = get_perms(self.request.user,
+                self.object.organization)
+        return self._organization_permissions
+
+    def get_feedback_list(self):
+        """
+        Returns the decision's feedback, each with its comments as
+        feedback.comments, using one query for the feedback and one for all
+        of the comments however much feedback there is.
+        """
+        feedback_list = list(self.object.feedback_set
+            .select_related('author', 'editor').order_by('id'))
+        if not feedback_list:
+            return feedback_list
+        # The same comments as the get_comment_list template tag finds
+        comments = Comment.objects.for_model(Feedback).filter(
+            object_pk__in=[unicode(feedback.id) for feedback in feedback_list],
+            site__pk=settings.SITE_ID, is_public=True
+        ).select_related('user')
+        if getattr(settings, 'COMMENTS_HIDE_REMOVED', True):
+            comments = comments.filter(is_removed=False)
+        comments_by_feedback = group_by(comments, 'object_pk')
+        for feedback in feedback_list:
+            feedback.comments = comments_by_feedback.get(unicode(feedback.id),
+                                                         [])
+        return feedback_list
+
+
+class DecisionList(CursorPaginationMixin, ListView):
     DEFAULT = Decision.DISCUSSION_STATUS
+    # Seconds a rendered list row is cached for. Rows are cached by
+    # last_modified, so this only limits how long stale rows stay around.
+    DEFAULT_ROW_CACHE_TIMEOUT = 600
 
     model = Decision
 
@@ -213,6 +270,7 @@ class DecisionList(ListView):
         self.status = kwargs.get('status', DecisionList.DEFAULT)
         return self.status
 
+    @method_decorator(revalidated(decision_list_etag))
     def get(self, request, *args, **kwargs):
         self.set_status(**kwargs)
         self.set_sorting(request)
@@ -221,17 +279,38 @@ class DecisionList(ListView):
         return super(DecisionList, self).get(request, *args, **kwargs)
 
     def get_queryset(self):
-        if self.sort_field in self.sort_by_count_fields:
+        # Filtering before sorting lets the sorts use the indexes on
+        # (organization, status, column)
+        filters = {'organization': self.organization, 'status': self.status}
+        if self.use_cursor_pagination():
+            # Each page is sorted by the cursor pagination
+            qs = Decision.objects.filter(**filters)
+        elif self.sort_field in self.sort_by_count_fields:
             qs = Decision.objects.order_by_count(
-                self.sort_field, self.sort_order)
+                self.sort_field, self.sort_order, **filters)
         elif self.sort_field in self.sort_by_alpha_fields:
             qs = Decision.objects.order_by_case_insensitive(
-                self.sort_field, self.sort_order)
+                self.sort_field, self.sort_order, **filters)
         else:
             qs = Decision.objects.order_null_last(
-                self.sort_order + self.sort_field)
-        return qs.filter(
-            status=self.status).filter(organization=self.organization)
+                self.sort_order + self.sort_field, **filters)
+        return qs.only(*self.get_list_columns())
+
+    def get_list_columns(self):
+        """
+        Returns the columns the list shows for the current tab, plus the
+        sort column and last_modified, which keys the cached rows. The
+        description in particular is left out.
+        """
+        columns = set(['id', 'last_modified', self.sort_field])
+        for header in self.sort_table_headers[self.status]:
+            if header not in self.unsortable_fields:
+                columns.add(header)
+        for field in self.sort_by_count_fields:
+            if field in columns:
+                columns.remove(field)
+                columns.add(field + '_count')
+        return sorted(columns)
 
     def get_context_data(self, *args, **kwargs):
         context = super(DecisionList, self).get_context_data(**kwargs)
@@ -242,8 +321,24 @@ class DecisionList(ListView):
         context['num'] = self.paginate_by
         context['prevstring'] = self.build_prev_query_string(context)
         context['nextstring'] = self.build_next_query_string(context)
+        context['watched_ids'] = self.get_watched_ids(context['object_list'])
+        for decision in context['object_list']:
+            decision.is_watched = decision.id in context['watched_ids']
+        context['row_cache_timeout'] = getattr(settings,
+            'DECISION_LIST_ROW_CACHE_TIMEOUT', self.DEFAULT_ROW_CACHE_TIMEOUT)
         return context
 
+    def get_watched_ids(self, decisions):
+        """
+        Returns the ids of the listed decisions that the user is watching,
+        found with a single query for the whole page.
+        """
+        return set(notification.ObservedItem.objects.filter(
+            user=self.request.user,
+            content_type=ContentType.objects.get_for_model(Decision),
+            object_id__in=[decision.id for decision in decisions]
+        ).values_list('object_id', flat=True))
+
     # SORTING ##########################################################
 
     # sort_options
@@ -338,6 +433,13 @@ class DecisionList(ListView):
 
         return request.path + sort_query
 
+    def get_sort_key(self):
+        field_name = self.sort_field
+        if field_name in self.sort_by_count_fields:
+            field_name += '_count'
+        return SortKey(Decision, field_name, self.sort_order == '-',
+                       lower=self.sort_field in self.sort_by_alpha_fields)
+
     # END SORTING ##########################################################
 
     # PAGINATION ##########################################################
@@ -360,8 +462,8 @@ class DecisionList(ListView):
                 if num_num_int <= 0:
                     raise ValueError
             except ValueError:
-                request.session['num'] = \
-                    self.paginate_by = self.default_num_items
+                self.paginate_by = self.default_num_items
+                remember_page_size(request, self.paginate_by)
                 return
 
         # Set to default in case where a link has been sent that includes page number, but doesn't include a num
@@ -374,11 +476,14 @@ class DecisionList(ListView):
                 request.session.get('num', self.default_num_items))
 
         # Finally set as user's session value
-        request.session['num'] = self.paginate_by
+        remember_page_size(request, self.paginate_by)
 
     def build_prev_query_string(self, context):
         if not context['page_obj']:
             return None
+        elif isinstance(context['page_obj'], CursorPage):
+            return self.build_query_string(context,
+                context['page_obj'].previous_cursor(), 'before')
         else:
             return self.build_query_string(context,
                 context['page_obj'].previous_page_number())
@@ -386,12 +491,15 @@ class DecisionList(ListView):
     def build_next_query_string(self, context):
         if not context['page_obj']:
             return None
+        elif isinstance(context['page_obj'], CursorPage):
+            return self.build_query_string(context,
+                context['page_obj'].next_cursor(), 'after')
         else:
             return self.build_query_string(context,
                 context['page_obj'].next_page_number())
 
-    def build_query_string(self, context, page_num):
-        page_query = 'page=' + str(page_num)
+    def build_query_string(self, context, page_num, page_param='page'):
+        page_query = page_param + '=' + str(page_num)
         # prepend non-default number of items per page
         if not context['num'] == self.default_num_items:
             page_query = 'num=' + str(context['num']) + '&' + page_query
@@ -581,6 +689,47 @@ class FeedbackUpdate(UpdateView):
         return reverse('publicweb_item_detail', args=[self.object.decision.pk])
 
 
+def get_feedback_json_data(feedback):
+    """
+    The parts of a feedback that the item detail page shows, with the
+    feedback counts of its decision.
+    """
+    return {
+        'id': feedback.id,
+        'rating': feedback.get_rating_display(),
+        'description': render_description(feedback.description),
+        'counters': feedback.decision.get_feedback_statistics(),
+    }
+
+
+class FeedbackCreateJSON(JSONFormMixin, FeedbackCreate):
+    def get_json_data(self):
+        data = get_feedback_json_data(self.object)
+        data['html'] = render_to_string('feedback_detail_snippet.html',
+            {'object': self.object}, context_instance=RequestContext(self.request))
+        return data
+
+
+class FeedbackUpdateJSON(JSONFormMixin, FeedbackUpdate):
+    def get_json_data(self):
+        return get_feedback_json_data(self.object)
+
+
+class DecisionUpdateJSON(JSONFormMixin, DecisionUpdate):
+    def get_json_data(self):
+        return {
+            'id': self.object.id,
+            'status': self.object.status,
+            'last_modified': self.object.last_modified,
+            'counters': self.object.get_feedback_statistics(),
+            'html': render_to_string('decision_detail_snippet.html', {
+                'object': self.object,
+                'organization': self.object.organization,
+                'rating_names': [unicode(x) for x in Feedback.rating_names],
+            }, context_instance=RequestContext(self.request)),
+        }
+
+
 class EconsensusActionitemCreateView(ActionItemCreateView):
     template_name = 'actionitem_create_snippet.html'
     form_class = EconsensusActionItemCreateForm
@@ -635,7 +784,20 @@ class EconsensusActionitemUpdateView(ActionItemUpdateView):
         return kwargs
 
 
-class EconsensusActionitemListView(ActionItemListView):
+class EconsensusActionitemUpdateJSON(JSONFormMixin,
+                                    EconsensusActionitemUpdateView):
+    def get_json_data(self):
+        deadline = self.object.deadline
+        return {
+            'id': self.object.id,
+            'responsible': self.object.responsible,
+            'deadline': deadline and formats.localize(deadline),
+            'description': render_description(self.object.description),
+            'done': self.object.done,
+        }
+
+
+class EconsensusActionitemListView(CursorPaginationMixin, ActionItemListView):
     template_name = 'decision_list.html'
 
     @method_decorator(login_required)
@@ -653,8 +815,11 @@ class EconsensusActionitemListView(ActionItemListView):
         return super(EconsensusActionitemListView, self).get(request, *args, **kwargs)
 
     def get_queryset(self):
+        # Only the listed columns, with just the id of the parent item
+        columns = self.sort_table_headers[self.status] + ['origin__id']
         qs = ActionItem.objects \
-                .filter(origin__organization=self.organization)
+                .filter(origin__organization=self.organization) \
+                .select_related('origin').only(*columns)
         if self.sort_field in self.sort_by_alpha_fields:
             qs = qs.extra(select={'lower': "lower(" + self.sort_field + ")"}).order_by(self.sort_order + 'lower')
         else:
@@ -752,6 +917,10 @@ class EconsensusActionitemListView(ActionItemListView):
 
         return request.path + sort_query
 
+    def get_sort_key(self):
+        return SortKey(ActionItem, self.sort_field, self.sort_order == '-',
+                       lower=self.sort_field in self.sort_by_alpha_fields)
+
     # END SORTING ##########################################################
 
     # PAGINATION ##########################################################
@@ -776,8 +945,8 @@ class EconsensusActionitemListView(ActionItemListView):
                 if num_num_int <= 0:
                     raise ValueError
             except ValueError:
-                request.session['num'] = \
-                    self.paginate_by = self.default_num_items
+                self.paginate_by = self.default_num_items
+                remember_page_size(request, self.paginate_by)
                 return
 
         # Set to default in case where a link has been sent that includes page
@@ -791,11 +960,17 @@ class EconsensusActionitemListView(ActionItemListView):
             self.paginate_by = request.GET.get('num', num)
 
         # Finally set as user's session value
-        request.session['num'] = self.paginate_by
+        remember_page_size(request, self.paginate_by)
 
     def build_prev_query_string(self, context):
         if not context['page_obj']:
             return None
+        elif isinstance(context['page_obj'], CursorPage):
+            return self.build_query_string(
+                context,
+                context['page_obj'].previous_cursor(),
+                'before'
+            )
         else:
             return self.build_query_string(
                 context,
@@ -805,14 +980,20 @@ class EconsensusActionitemListView(ActionItemListView):
     def build_next_query_string(self, context):
         if not context['page_obj']:
             return None
+        elif isinstance(context['page_obj'], CursorPage):
+            return self.build_query_string(
+                context,
+                context['page_obj'].next_cursor(),
+                'after'
+            )
         else:
             return self.build_query_string(
                 context,
                 context['page_obj'].next_page_number()
             )
 
-    def build_query_string(self, context, page_num):
-        page_query = 'page=' + str(page_num)
+    def build_query_string(self, context, page_num, page_param='page'):
+        page_query = page_param + '=' + str(page_num)
         # prepend non-default number of items per page
         if not context['num'] == self.default_num_items:
             page_query = 'num=' + str(context['num']) + '&' + page_query
@@ -913,7 +1094,7 @@ class DecisionSearchView(SearchView):
         num = request.GET.get('num')
         if not num: num = request.session.get('num')
         if not num: num = str(self.DEFAULT_RESULTS_PER_PAGE)
-        request.session['num'] = num
+        remember_page_size(request, num)
         self.results_per_page = int(num)
 
         return super(DecisionSearchView, self).__call__(request)